@@ -0,0 +1,372 @@
+# ******************************************************************************
+#
+# DSF2Blender: Python script for Blender that allows import of X-Plane DSF files
+#              Checked with Blender 3.0 but should work from 2.8 up
+#
+# For more details refer to GitHub: https://github.com/nofaceinbook/DSF2Blender
+#
+# WARNING: This code is still under development and may still have some errors.
+#
+# Copyright (C) 2022 by schmax (Max Schmidt)
+#
+# This code is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+# ******************************************************************************
+
+# Benchmark of the import with synthetic dsf data, so neither X-Plane nor real dsf files are needed.
+# A tile is generated in memory with the same structure XPLNEDSF returns after reading a dsf: vertex pools with
+# 5, 7 and 9 values per vertex, basemesh patches of projected (orthophoto) and global terrains, water, border
+# overlays and overlays on top of each other. Matching .ter files and textures are written to a scenery and an
+# X-Plane directory. Same size and seed always generate the same tile, so results can be compared across commits.
+#
+# In Blender terrain loading (read_ter_file), extraction and mesh building are measured:
+#     blender --background --python dsf_bench.py -- --size large --report bench.json
+# With plain Python (no bpy) only the extraction is measured:
+#     python dsf_bench.py --size ortho --report bench.json
+# Reading of the dsf file itself is not part of the benchmark, as the tile is generated in memory.
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # find the other modules also when run by Blender
+
+import numpy as np
+import dsf_extract
+import dsf_profile
+import dsf_terrain
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+# quads per side of the tile; each quad is two basemesh triangles, ortho is about the density of an Ortho4XP tile
+SIZES = {"small": 64, "medium": 256, "large": 1024, "ortho": 1408}
+BLOCKS = 16  # blocks per side of the tile, each with own terrain and vertex pool like the textures of Ortho4XP
+GLOBAL_TERRAINS = ["grass", "forest", "rock", "farm", "town", "sand", "shrub", "lava"]
+
+
+class SyntheticRaster:
+    """
+    Elevation raster like XPLNEDSF.Raster with data[x][y] in meter from west/south corner of the tile.
+    """
+    def __init__(self, size, function):
+        self.width = size
+        self.height = size
+        self.scale = 1.0
+        self.offset = 0.0
+        x, y = np.meshgrid(np.linspace(0, 1, size), np.linspace(0, 1, size), indexing="ij")
+        self.data = function(x, y).tolist()
+
+
+class SyntheticPatch:
+    """
+    Patch like in XPLNEDSF.Patches. Triangles are created when requested from a grid of quads in one vertex pool,
+    where the pool contains (columns + 1) x (rows + 1) vertices.
+    """
+    def __init__(self, flag, defIndex, near, far, pool, rows, quads):
+        self.flag = flag
+        self.defIndex = defIndex
+        self.near = near
+        self.far = far
+        self.pool = pool
+        self.rows = rows
+        self.quads = quads  # list of column, row of the quads in the grid of the pool
+
+    def triangles(self):
+        trias = []
+        p = self.pool
+        r = self.rows + 1
+        for c, row in self.quads:
+            a = c * r + row  # vertex index of south west corner; x-plane winding is clockwise
+            trias.append([[p, a], [p, a + 1], [p, a + r + 1]])
+            trias.append([[p, a], [p, a + r + 1], [p, a + r]])
+        return trias
+
+
+class SyntheticDSF:
+    """
+    Tile with the attributes of XPLNEDSF used by the import: Properties, DefTerrains, V, Patches and Raster.
+    """
+    def __init__(self, quads, seed=1, west=10, south=50):
+        self.quads = quads
+        self.Properties = {"sim/west": str(west), "sim/south": str(south), "sim/east": str(west + 1), "sim/north": str(south + 1)}
+        self.DefTerrains = dict()
+        self.V = []
+        self.Patches = []
+        self.Raster = [SyntheticRaster(min(quads + 1, 1201), self._elevation)]
+        self.west = west
+        self.south = south
+        self._generate(random.Random(seed))
+
+    @staticmethod
+    def _elevation(x, y):
+        return 300 + 200 * np.sin(6 * x) * np.cos(4 * y) + 50 * np.sin(40 * x + 30 * y)
+
+    def getVertexElevation(self, x, y, z=dsf_extract.RASTER_ELEVATION):
+        """
+        Returns z or if it is the raster marker the bilinear interpolated elevation of the raster at x, y.
+        """
+        if int(z) != dsf_extract.RASTER_ELEVATION:
+            return z
+        r = self.Raster[0]
+        px = min(max((x - self.west) * (r.width - 1), 0), r.width - 1)
+        py = min(max((y - self.south) * (r.height - 1), 0), r.height - 1)
+        x0 = min(int(px), r.width - 2)
+        y0 = min(int(py), r.height - 2)
+        fx = px - x0
+        fy = py - y0
+        d = r.data
+        e = (d[x0][y0] * (1 - fx) + d[x0 + 1][y0] * fx) * (1 - fy) + (d[x0][y0 + 1] * (1 - fx) + d[x0 + 1][y0 + 1] * fx) * fy
+        return e * r.scale + r.offset
+
+    def _terrain(self, name):
+        for id, t in self.DefTerrains.items():
+            if t == name:
+                return id
+        self.DefTerrains[len(self.DefTerrains)] = name
+        return len(self.DefTerrains) - 1
+
+    def _pool(self, bi, bj, size, planes, raster):
+        """
+        Adds vertex pool with the grid of the block and returns its index.
+        """
+        n = self.quads
+        i = np.arange(bi * size, (bi + 1) * size + 1)
+        j = np.arange(bj * size, (bj + 1) * size + 1)
+        x, y = np.meshgrid(i / n, j / n, indexing="ij")  # column major like the quads in SyntheticPatch
+        x = x.ravel()
+        y = y.ravel()
+        values = [self.west + x, self.south + y]
+        if raster:
+            values.append(np.full(len(x), float(dsf_extract.RASTER_ELEVATION)))
+        else:
+            values.append(self._elevation(x, y))
+        e = 0.001  # normals from slope of the elevation function
+        values.append(np.clip((self._elevation(x - e, y) - self._elevation(x + e, y)) / 200, -0.7, 0.7))
+        values.append(np.clip((self._elevation(x, y - e) - self._elevation(x, y + e)) / 200, -0.7, 0.7))
+        if planes >= 7:
+            values += [(x * n) % 8 / 8, (y * n) % 8 / 8]
+        if planes >= 9:
+            values += [(x - i[0] / n) * n / size, (y - j[0] / n) * n / size]
+        self.V.append(np.column_stack(values).tolist())
+        return len(self.V) - 1
+
+    def _patch(self, flag, terrain, pool, size, quads, far=-1):
+        self.Patches.append(SyntheticPatch(flag, self._terrain(terrain), 0.0, far, pool, size, quads))
+
+    def _generate(self, rng):
+        blocks = min(BLOCKS, self.quads)
+        size = self.quads // blocks
+        self.quads = blocks * size  # quads per side are multiple of blocks, so that the blocks cover the tile
+        all_quads = [(c, r) for c in range(size) for r in range(size)]
+        kinds = dict()
+        for bi in range(blocks):
+            for bj in range(blocks):
+                kinds[(bi, bj)] = rng.choice(("ortho", "ortho", "global", "global", "water"))
+
+        for (bi, bj), kind in kinds.items():
+            if kind == "ortho":  # projected terrain with uvs from LOAD_CENTER, explicit elevation
+                pool = self._pool(bi, bj, size, 5, False)
+                self._patch(1, "terrain/ortho_{}_{}.ter".format(bi, bj), pool, size, all_quads)
+            elif kind == "global":  # terrain with uvs in the pool, elevation from raster
+                pool = self._pool(bi, bj, size, 7, True)
+                self._patch(1, "lib/g10/terrain10/{}.ter".format(rng.choice(GLOBAL_TERRAINS)), pool, size, all_quads)
+            else:  # projected water
+                pool = self._pool(bi, bj, size, 5, True)
+                self._patch(1, "terrain_Water", pool, size, all_quads)
+
+        half = [(c, r) for c, r in all_quads if c < size // 2 or size == 1]
+        for (bi, bj), kind in kinds.items():
+            if kind == "global" and rng.random() < 0.5:  # border overlay of other terrain with border uvs
+                pool = self._pool(bi, bj, size, 9, True)
+                self._patch(2, "lib/g10/terrain10/{}.ter".format(rng.choice(GLOBAL_TERRAINS)), pool, size, half)
+                if rng.random() < 0.5:  # second overlay on the same triangles
+                    self._patch(2, "lib/g10/terrain10/{}.ter".format(rng.choice(GLOBAL_TERRAINS)), pool, size, half, 20000)
+            if kind != "water" and kinds.get((bi + 1, bj)) == "water":  # water overlay at the coast with border uvs
+                pool = self._pool(bi, bj, size, 7, True)
+                self._patch(2, "terrain_Water", pool, size, [(c, r) for c, r in all_quads if c >= size // 2])
+
+        order = list(range(len(self.Patches)))  # patches are not sorted by terrain in a dsf
+        rng.shuffle(order)
+        self.Patches = [self.Patches[i] for i in order]
+
+    def write_terrains(self, scenery, xp_path):
+        """
+        Writes the .ter files and textures of the terrains of this tile to scenery and X-Plane directory.
+        """
+        tile = "{:+03d}{:+04d}".format(self.south, self.west)
+        folder = "{:+03d}{:+04d}".format(self.south // 10 * 10, self.west // 10 * 10)
+        for name in self.DefTerrains.values():
+            if name.startswith("terrain/"):
+                _write_ter(os.path.join(scenery, name), ["LOAD_CENTER {} {} 4000 4096".format(self.south + 0.5, self.west + 0.5),
+                                                         "BASE_TEX_NOWRAP ../textures/{}.png".format(name[8:-4]), "NO_ALPHA"])
+                _write_png(os.path.join(scenery, "textures", name[8:-4] + ".png"))
+            elif name.startswith("lib/g10/"):
+                terrain = os.path.join(xp_path, "Resources", "default scenery", "1000 world terrain", name[8:])
+                texture = os.path.splitext(os.path.basename(name))[0]
+                _write_ter(terrain, ["BASE_TEX ../textures10/{}.png".format(texture), "BORDER_TEX ../textures10/border.png"])
+                _write_png(os.path.join(os.path.dirname(terrain), "..", "textures10", texture + ".png"))
+                _write_png(os.path.join(os.path.dirname(terrain), "..", "textures10", "border.png"))
+        _write_png(os.path.join(xp_path, "Resources", "bitmaps", "world", "water", "any.png"))
+        return os.path.join(scenery, "Earth nav data", folder, tile + ".dsf").replace("\\", "/")
+
+    def n_triangles(self):
+        return sum(2 * len(p.quads) for p in self.Patches)
+
+
+def _write_ter(filename, lines):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, "w", encoding="utf8") as f:
+        f.write("A\n800\nTERRAIN\n\n" + "\n".join(lines) + "\n")
+
+
+def _write_png(filename, size=4):
+    """
+    Writes small grey png, so that textures of the terrains exist.
+    """
+    if os.path.exists(filename):
+        return
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    pixels = b"".join(b"\x00" + b"\x80\x80\x80" * size for _ in range(size))
+    with open(filename, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(pixels)))
+        f.write(chunk(b"IEND", b""))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="dsf_bench.py", description="Benchmark import of synthetic dsf tile")
+    parser.add_argument("--size", choices=sorted(SIZES, key=SIZES.get), default="medium", help="density of the tile (default medium)")
+    parser.add_argument("--quads", type=int, default=0, help="quads per side of the tile instead of size (multiple of 16)")
+    parser.add_argument("--seed", type=int, default=1, help="seed for generation of the tile (default 1)")
+    parser.add_argument("--overlay-per-terrain", action="store_true", help="create seperate overlays per terrain type")
+    parser.add_argument("--engine", choices=("NUMPY", "PYTHON"), default="NUMPY", help="extraction engine (PYTHON only in Blender)")
+    parser.add_argument("--memory-budget", type=int, default=0, help="MB for arrays of the tile and extracted data per batch when streaming (0 no streaming)")
+    parser.add_argument("--cells", type=int, default=1, help="split layers into NxN objects (Blender only)")
+    parser.add_argument("--lod-distance", type=float, default=-1, help="only patches shown at this view distance in meters (default all)")
+    parser.add_argument("--lod-objects", action="store_true", help="split layers into objects per view distance range (Blender only)")
+    parser.add_argument("--simplify-triangles", type=int, default=0, help="simplify basemesh to about N triangles per batch (Blender only)")
+    parser.add_argument("--simplify-cell", type=float, default=0.0, help="merge basemesh vertices in cells of this size (Blender only)")
+    parser.add_argument("--repeat", type=int, default=1, help="number of runs, each with newly generated tile")
+    parser.add_argument("--directory", default="", help="directory for terrain files (default temporary, removed after run)")
+    parser.add_argument("--report", default="", help="write settings and stages of all runs as json to this file")
+    parser.add_argument("--trace-memory", action="store_true", help="record memory allocated per stage instead of process peak so far (slower)")
+    return parser.parse_args(argv)
+
+
+def commit():
+    """
+    Returns git commit of this repository or empty string if not available.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_extraction(args, dsf, profiler):
+    """
+    Extracts the synthetic tile without Blender and returns number of extracted triangles.
+    """
+    grid_west = int(dsf.Properties["sim/west"])
+    grid_south = int(dsf.Properties["sim/south"])
+    area = dsf_extract.tile_area((0.0, 1.0, 0.0, 1.0), grid_west, grid_south)
+    with profiler.stage("sort patches", len(dsf.Patches)):
+        ter_layers = dsf_extract.visible_layers(dsf_extract.sort_patches(dsf), args.lod_distance)
+    batches = dsf_extract.extract_batches(dsf, ter_layers, grid_west, grid_south, area, 1000, args.overlay_per_terrain,
+                                          dsf_extract.budget_triangles(dsf, args.memory_budget, profiler), profiler)
+    n_trias = 0
+    for extracted in profiler.iterate("extract triangles", batches):
+        n_trias += sum(len(f) for f in extracted[2])
+    return n_trias
+
+
+def run_import(args, dsf, dsf_file, xp_path, profiler):
+    """
+    Imports the synthetic tile in Blender with the same stages as DSF_loader.execute.
+    """
+    import dsf_import_file_menu
+    bpy.ops.wm.read_factory_settings(use_empty=True)  # every run starts with empty scene
+    importer = dsf_import_file_menu.DSF_loader(0.0, 1.0, 0.0, 1.0, 1000, args.overlay_per_terrain, args.engine,
+                                               args.memory_budget, args.cells, "", 0, "", "LOAD", 0, args.lod_distance, args.lod_objects,
+                                               args.simplify_triangles, args.simplify_cell)
+    importer.profiler = profiler
+    importer.terrain_cache = dsf_terrain.TerrainCache()  # every run reads the terrain files
+    importer.xp_path = xp_path
+    grid_west = int(dsf.Properties["sim/west"])
+    grid_south = int(dsf.Properties["sim/south"])
+    importer.set_tile(grid_west, grid_south)
+    terrain_details = importer.load_terrains(dsf.DefTerrains, dsf_file)
+    with profiler.stage("sort patches", len(dsf.Patches)):
+        ter_layers = dsf_extract.visible_layers(dsf_extract.sort_patches(dsf), args.lod_distance)
+    batches = profiler.iterate("extract triangles", importer.extract_batches(dsf, ter_layers, terrain_details, grid_west, grid_south))
+    importer.create_objects(dsf.DefTerrains, terrain_details, batches)
+
+
+def main(argv):
+    args = parse_args(argv)
+    quads = args.quads or SIZES[args.size]
+    directory = args.directory or tempfile.mkdtemp(prefix="dsf_bench_")
+    scenery = os.path.join(directory, "Custom Scenery", "Synthetic")
+    xp_path = directory.replace("\\", "/")
+    settings = {"quads": quads, "seed": args.seed, "overlay_per_terrain": args.overlay_per_terrain, "engine": args.engine,
+                "memory_budget": args.memory_budget, "cells": args.cells,
+                "lod_distance": args.lod_distance, "lod_objects": args.lod_objects,
+                "simplify_triangles": args.simplify_triangles, "simplify_cell": args.simplify_cell, "commit": commit(), "python": platform.python_version(),
+                "numpy": np.__version__, "blender": bpy.app.version_string if bpy else None}
+    runs = []
+    try:
+        for run in range(args.repeat):
+            print("Generating synthetic tile with {} quads per side".format(quads))
+            dsf = SyntheticDSF(quads, args.seed)
+            dsf_file = dsf.write_terrains(scenery, xp_path)
+            settings.update({"patches": len(dsf.Patches), "triangles": dsf.n_triangles(), "terrains": len(dsf.DefTerrains),
+                             "vertices": sum(len(pool) for pool in dsf.V)})
+            print("Run {}: {} patches with {} triangles".format(run + 1, settings["patches"], settings["triangles"]))
+            profiler = dsf_profile.Profiler(True, args.trace_memory)
+            if bpy is None:
+                run_extraction(args, dsf, profiler)
+            else:
+                run_import(args, dsf, dsf_file, xp_path, profiler)
+            profiler.print_report()
+            runs.append(profiler.report())
+            del dsf
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    best = dict()  # fastest run per stage, which is the least disturbed by other load on the machine
+    for report in runs:
+        for name, values in report["stages"].items():
+            best[name] = min(values["wall"], best.get(name, values["wall"]))
+    for name, wall in best.items():
+        print("BEST {:<40} wall {:9.3f}s".format(name, wall))
+    if args.report:
+        with open(args.report, "w", encoding="utf8") as f:
+            json.dump({"settings": settings, "best_wall": best, "runs": runs}, f, indent=2)
+        print("Written benchmark report to {}".format(args.report))
+    return 0
+
+
+if __name__ == "__main__":
+    if "--" in sys.argv:  # called from Blender, which passes arguments for the script after --
+        sys.exit(main(sys.argv[sys.argv.index("--") + 1:]))
+    else:
+        sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,204 @@
+# ******************************************************************************
+#
+# DSF2Blender: Python script for Blender that allows import of X-Plane DSF files
+#              Checked with Blender 3.0 but should work from 2.8 up
+#
+# For more details refer to GitHub: https://github.com/nofaceinbook/DSF2Blender
+#
+# WARNING: This code is still under development and may still have some errors.
+#
+# Copyright (C) 2022 by schmax (Max Schmidt)
+#
+# This code is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+# ******************************************************************************
+
+# Cache on disk for the arrays extracted from a dsf file (see dsf_extract.py).
+# For each dsf file and import settings a directory is created containing info.json and one .dsfmesh file per batch.
+# info.json is written last, so only complete extractions are found in the cache.
+#
+# A .dsfmesh file is memory mapped when read, so the arrays are views into the file instead of copies in memory.
+# Layout: MESH_MAGIC, version and length of table of contents (2 x uint32 little endian), then table of contents
+# as json with name, dtype, shape and offset for each block, then the blocks each starting at BLOCK_ALIGN bytes.
+# Reduced textures (proxies) are stored in the subdirectory PROXY_DIR with a name depending on texture file and size.
+# This module does not use bpy, so it can also be used outside of Blender.
+
+import hashlib
+import json
+import os
+import struct
+import numpy as np
+import dsf_extract
+
+CACHE_VERSION = 3  # increase when extraction or format changes, so that old cache entries are not used
+MESH_MAGIC = b"DSF2BMSH"
+BLOCK_ALIGN = 64
+PROXY_DIR = "proxies"
+
+# fixed types of the blocks per layer, which are the types Blender uses for the mesh data
+BLOCK_TYPES = {"verts": ("<f4", 3), "normals": ("<f4", 3), "faces": ("<i4", 3), "uvs": ("<f4", 2), "uvs2": ("<f4", 2), "mats": ("<i4", 0)}
+
+
+def write_mesh_file(filename, arrays):
+    """
+    Writes dict of arrays with name as key as .dsfmesh file. Names must start with a key of BLOCK_TYPES.
+    """
+    toc = dict()
+    blocks = []
+    offset = 0
+    for name, a in arrays.items():
+        dtype, columns = BLOCK_TYPES[name.split("_")[0]]
+        a = np.ascontiguousarray(a, dtype=dtype)
+        if columns:
+            a = a.reshape(-1, columns)
+        toc[name] = [dtype, list(a.shape), offset]
+        blocks.append(a)
+        offset += _aligned(a.nbytes)
+    toc = json.dumps(toc).encode("utf8")
+    start = _aligned(len(MESH_MAGIC) + 8 + len(toc))  # first block after header
+
+    with open(filename, "wb") as f:
+        f.write(MESH_MAGIC)
+        f.write(struct.pack("<II", CACHE_VERSION, len(toc)))
+        f.write(toc)
+        f.write(bytes(start - f.tell()))
+        for a in blocks:
+            f.write(a.tobytes())
+            f.write(bytes(_aligned(a.nbytes) - a.nbytes))
+
+
+def map_mesh_file(filename):
+    """
+    Returns dict with name and array of all blocks in .dsfmesh file. Arrays are read-only views into the mapped file.
+    """
+    with open(filename, "rb") as f:
+        header = f.read(len(MESH_MAGIC) + 8)
+        if header[:len(MESH_MAGIC)] != MESH_MAGIC:
+            raise ValueError("No dsfmesh file: " + filename)
+        version, toc_length = struct.unpack("<II", header[len(MESH_MAGIC):])
+        if version != CACHE_VERSION:
+            raise ValueError("Wrong version of dsfmesh file: " + filename)
+        toc = json.loads(f.read(toc_length).decode("utf8"))
+    start = _aligned(len(MESH_MAGIC) + 8 + toc_length)
+    data = np.memmap(filename, dtype=np.uint8, mode="r")
+    arrays = dict()
+    for name, (dtype, shape, offset) in toc.items():
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        arrays[name] = data[start + offset:start + offset + nbytes].view(dtype).reshape(shape)
+    return arrays
+
+
+def _aligned(n):
+    return -(-n // BLOCK_ALIGN) * BLOCK_ALIGN
+
+
+def cache_key(dsf_file, options):
+    """
+    Returns key for the extraction of dsf_file with the options (tuple of import settings).
+    Key depends on path, size and modification time of the file and a hash of its beginning and end.
+    """
+    st = os.stat(dsf_file)
+    h = hashlib.sha1()
+    with open(dsf_file, "rb") as f:
+        h.update(f.read(65536))
+        if st.st_size > 65536:
+            f.seek(max(65536, st.st_size - 65536))
+            h.update(f.read(65536))
+    h.update(repr((CACHE_VERSION, os.path.abspath(dsf_file), st.st_size, st.st_mtime_ns, options)).encode("utf8"))
+    return h.hexdigest()
+
+
+def load_info(cache_dir, key):
+    """
+    Returns the info dict stored for key or None if key is not (completely) in the cache.
+    Info contains west, south, terrains (dict of terrain definitions) and per batch materials and used_materials.
+    """
+    filename = os.path.join(cache_dir, key, "info.json")
+    try:
+        with open(filename, encoding="utf8") as f:
+            info = json.load(f)
+    except (IOError, ValueError):
+        return None
+    if info.get("version") != CACHE_VERSION:
+        return None
+    info["terrains"] = {int(id): name for id, name in info["terrains"]}
+    for batch in info["batches"]:
+        batch["materials"] = [tuple(m) for m in batch["materials"]]
+    return info
+
+
+def load_batches(cache_dir, key, info):
+    """
+    Generator returning the extracted arrays of the batches stored for key, one batch after the other.
+    Arrays are memory mapped views into the cache files.
+    """
+    for b, batch in enumerate(info["batches"]):
+        data = map_mesh_file(os.path.join(cache_dir, key, "batch_{}.dsfmesh".format(b)))
+        n = batch["layers"]
+        faces = [data["faces_{}".format(l)] for l in range(n)]
+        uvs = [data["uvs_{}".format(l)] for l in range(n)]
+        uvs2 = [data["uvs2_{}".format(l)] for l in range(n)]
+        matIndexPerTria = [data["mats_{}".format(l)] for l in range(n)]
+        yield data["verts"], data["normals"], faces, uvs, uvs2, batch["materials"], matIndexPerTria, batch["used_materials"]
+
+
+def save_batches(cache_dir, key, batches, west, south, terrains):
+    """
+    Generator passing through the extracted batches while storing each of them under key.
+    After the last batch info.json is written, which makes the entry available.
+    """
+    directory = os.path.join(cache_dir, key)
+    os.makedirs(directory, exist_ok=True)
+    info = {"version": CACHE_VERSION, "west": west, "south": south, "batches": [],
+            "terrains": [[id, name] for id, name in terrains.items()]}
+    b = 0  # counted by hand, as the result tuple of enumerate would keep the previous batch alive
+    for extracted in batches:
+        verts, normals, faces, uvs, uvs2, materials, matIndexPerTria, used_materials = extracted
+        arrays = {"verts": verts, "normals": normals}
+        for l in range(len(faces)):
+            arrays["faces_{}".format(l)] = faces[l]
+            arrays["uvs_{}".format(l)] = uvs[l]
+            arrays["uvs2_{}".format(l)] = uvs2[l]
+            arrays["mats_{}".format(l)] = matIndexPerTria[l]
+        write_mesh_file(os.path.join(directory, "batch_{}.dsfmesh".format(b)), arrays)
+        info["batches"].append({"layers": len(faces), "materials": [list(m) for m in materials],
+                                "used_materials": [list(u) for u in used_materials]})
+        yield extracted
+        # free the batch before the next one is extracted
+        del extracted, verts, normals, faces, uvs, uvs2, materials, matIndexPerTria, used_materials, arrays
+        b += 1
+    with open(os.path.join(directory, "info.json"), "w", encoding="utf8") as f:
+        json.dump(info, f)
+
+
+def proxy_filename(cache_dir, texture, max_size):
+    """
+    Returns filename of the proxy of texture file with at most max_size pixels width and height.
+    Name depends on path, size and modification time of the texture, so a changed texture gets a new proxy.
+    """
+    st = os.stat(texture)
+    h = hashlib.sha1(repr((os.path.abspath(texture), st.st_size, st.st_mtime_ns, max_size)).encode("utf8"))
+    name = os.path.splitext(os.path.basename(texture))[0]
+    return os.path.join(cache_dir, PROXY_DIR, "{}_{}_{}.png".format(name, max_size, h.hexdigest()[:16]))
+
+
+def import_options(area, scaling, layer_per_overlay, memory_budget, lod_distance=-1, engine="NUMPY"):
+    """
+    Returns tuple of the import settings the extraction depends on, as used for cache_key.
+    Engine is the one that really extracts, which is always "NUMPY" when streaming with memory budget.
+    """
+    return tuple(area) + (scaling, layer_per_overlay, memory_budget, lod_distance, engine)
+
+
+def extract_tile(dsf_file, area, scaling, layer_per_overlay, cache_dir, lod_distance=-1):
+    """
+    Extracts complete dsf_file into the cache, e.g. in a worker process, if it is not yet in the cache.
+    Key is the same as for an import without memory budget. Returns the key.
+    """
+    key = cache_key(dsf_file, import_options(area, scaling, layer_per_overlay, 0, lod_distance))
+    if load_info(cache_dir, key) is None:
+        west, south, terrains, extracted = dsf_extract.extract_tile(dsf_file, area, scaling, layer_per_overlay, lod_distance)
+        for _ in save_batches(cache_dir, key, [extracted], west, south, terrains):
+            pass
+    return key
@@ -0,0 +1,205 @@
+# ******************************************************************************
+#
+# DSF2Blender: Python script for Blender that allows import of X-Plane DSF files
+#              Checked with Blender 3.0 but should work from 2.8 up
+#
+# For more details refer to GitHub: https://github.com/nofaceinbook/DSF2Blender
+#
+# WARNING: This code is still under development and may still have some errors.
+#
+# Copyright (C) 2022 by schmax (Max Schmidt)
+#
+# This code is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+# ******************************************************************************
+
+# Command line import of dsf files with timing and memory of the stages.
+#
+# In Blender the full import is done and the result can be saved as .blend file:
+#     blender --background --python dsf_cli.py -- tile.dsf --save tile.blend
+# With plain Python (no bpy) only reading and extraction are done, e.g. to fill the cache or measure performance:
+#     python dsf_cli.py tile.dsf --area 0.4 0.6 0.4 0.6 --cache cachedir
+
+import argparse
+import concurrent.futures
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # find the other modules also when run by Blender
+
+import dsf_extract
+import dsf_cache
+import dsf_profile
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="dsf_cli.py", description="Import X-Plane dsf files with timing of the stages")
+    parser.add_argument("dsf", nargs="+", help="dsf files or directories containing dsf files")
+    parser.add_argument("--area", nargs=4, type=float, default=[0.0, 1.0, 0.0, 1.0], metavar=("WEST", "EAST", "SOUTH", "NORTH"),
+                        help="area relative to tile (0 to 1) or absolute in degree (default full tile)")
+    parser.add_argument("--scaling", type=int, default=1000, help="multiplier for degree tile (default 1000)")
+    parser.add_argument("--overlay-per-terrain", action="store_true", help="create seperate overlays per terrain type")
+    parser.add_argument("--engine", choices=("NUMPY", "PYTHON"), default="NUMPY", help="extraction engine (PYTHON only in Blender)")
+    parser.add_argument("--memory-budget", type=int, default=0, help="MB for arrays of the tile and extracted data per batch when streaming (0 no streaming)")
+    parser.add_argument("--cells", type=int, default=1, help="split layers into NxN objects (Blender only)")
+    parser.add_argument("--cache", default="", help="cache directory for extracted meshes")
+    parser.add_argument("--workers", type=int, default=0, help="processes extracting several tiles (0 for number of cores)")
+    parser.add_argument("--textures", choices=("LOAD", "LAZY", "BACKGROUND"), default="LOAD", help="when textures are read (Blender only)")
+    parser.add_argument("--proxy-size", type=int, default=0, help="replace larger textures by reduced proxies (Blender only, 0 for originals)")
+    parser.add_argument("--lod-distance", type=float, default=-1, help="only patches shown at this view distance in meters (default all)")
+    parser.add_argument("--lod-objects", action="store_true", help="split layers into objects per view distance range (Blender only)")
+    parser.add_argument("--simplify-triangles", type=int, default=0, help="simplify basemesh to about N triangles per batch (Blender only)")
+    parser.add_argument("--simplify-cell", type=float, default=0.0, help="merge basemesh vertices in cells of this size (Blender only)")
+    parser.add_argument("--heightfield", type=int, default=0, help="only heightfield with NxN grid squares from the elevations (0 for mesh)")
+    parser.add_argument("--incremental", action="store_true", help="update objects of an earlier import in the loaded .blend file")
+    parser.add_argument("--save", default="", help="save result as .blend file (Blender only)")
+    parser.add_argument("--report", default="", help="write time, memory and counts of the stages as json to this file")
+    parser.add_argument("--trace-memory", action="store_true", help="record memory allocated per stage instead of process peak so far (slower)")
+    return parser.parse_args(argv)
+
+
+def count_batches(batches):
+    """
+    Runs through the extracted batches without keeping them and returns number of batches, triangles and vertices.
+    """
+    n_batches = n_trias = n_verts = 0
+    for extracted in batches:
+        n_batches += 1
+        n_verts += len(extracted[0])
+        n_trias += sum(len(f) for f in extracted[2])
+        del extracted  # free the batch before the next one is extracted
+    return n_batches, n_trias, n_verts
+
+
+def extract_files(args, dsf_files):
+    """
+    Reads and extracts the dsf files without Blender with the numpy engine. With cache the extraction is stored
+    in the cache. Several dsf files are extracted by a pool of --workers processes, with memory budget or
+    heightfield one after the other.
+    """
+    profiler = dsf_profile.Profiler(True, args.trace_memory)
+    if args.engine == "PYTHON":
+        print("WARNING: The PYTHON engine needs Blender, extracting with the NUMPY engine")
+    if len(dsf_files) > 1 and not args.memory_budget and not args.heightfield:
+        extract_parallel(args, dsf_files, profiler)
+    else:
+        if len(dsf_files) > 1 and args.workers:
+            print("WARNING: Workers are not used with memory budget or heightfield, extracting one dsf file after the other")
+        for dsf_file in dsf_files:
+            extract_file(args, dsf_file, profiler)
+    profiler.print_report()
+    if args.report:
+        profiler.write_json(args.report)
+
+
+def extract_file(args, dsf_file, profiler):
+    """
+    Reads and extracts one dsf file, recording the stages with profiler.
+    """
+    if args.heightfield > 0:
+        print("Creating heightfield of {}".format(dsf_file))
+        verts, normals, faces, uvs = dsf_extract.heightfield_tile(dsf_file, args.area, args.scaling, args.heightfield, profiler)[2:]
+        print("Created heightfield with {} triangles and {} vertices".format(len(faces), len(verts)))
+        return
+    if args.cache:
+        key = dsf_cache.cache_key(dsf_file, dsf_cache.import_options(args.area, args.scaling, args.overlay_per_terrain,
+                                                                     args.memory_budget, args.lod_distance))
+        if dsf_cache.load_info(args.cache, key):
+            print("Already in cache: {}".format(dsf_file))
+            return
+    print("Extracting {}".format(dsf_file))
+    with profiler.stage("read dsf"):
+        dsf = dsf_extract.read_tile(dsf_file)
+    grid_west = int(dsf.Properties["sim/west"])
+    grid_south = int(dsf.Properties["sim/south"])
+    area = dsf_extract.tile_area(args.area, grid_west, grid_south)
+    with profiler.stage("sort patches", len(dsf.Patches)):
+        ter_layers = dsf_extract.visible_layers(dsf_extract.sort_patches(dsf), args.lod_distance)
+    batches = dsf_extract.extract_batches(dsf, ter_layers, grid_west, grid_south, area, args.scaling, args.overlay_per_terrain,
+                                          dsf_extract.budget_triangles(dsf, args.memory_budget, profiler), profiler)
+    batches = profiler.iterate("extract triangles", batches)
+    if args.cache:
+        batches = dsf_cache.save_batches(args.cache, key, batches, grid_west, grid_south, dict(dsf.DefTerrains))
+    n_batches, n_trias, n_verts = count_batches(batches)
+    print("Extracted {} triangles with {} vertices in {} batches".format(n_trias, n_verts, n_batches))
+
+
+def submit_tile(executor, args, dsf_file):
+    """
+    Starts extraction of dsf_file in the process pool executor and returns the future.
+    """
+    if args.cache:
+        return executor.submit(dsf_cache.extract_tile, dsf_file, args.area, args.scaling, args.overlay_per_terrain, args.cache,
+                               args.lod_distance)
+    return executor.submit(dsf_extract.extract_tile, dsf_file, args.area, args.scaling, args.overlay_per_terrain, args.lod_distance)
+
+
+def extract_parallel(args, dsf_files, profiler):
+    """
+    Extracts the dsf files by a pool of --workers processes like DSF_loader.execute_tiles, with at most one
+    tile per worker extracted or waiting at the same time. Only the time waiting for the workers is recorded.
+    """
+    workers = args.workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [submit_tile(executor, args, dsf_file) for dsf_file in dsf_files[:workers]]
+        for i, dsf_file in enumerate(dsf_files):
+            with profiler.stage("wait for extraction"):
+                result = futures.pop(0).result()
+            if i + workers < len(dsf_files):
+                futures.append(submit_tile(executor, args, dsf_files[i + workers]))
+            if args.cache:
+                print("Extracted {} into cache {}".format(dsf_file, result))
+            else:
+                n_batches, n_trias, n_verts = count_batches([result[3]])
+                print("Extracted {} triangles with {} vertices of {}".format(n_trias, n_verts, dsf_file))
+            del result
+
+
+def import_files(args, dsf_files):
+    """
+    Imports the dsf files in Blender and saves the result if requested.
+    The loader prints the report of the import, the report file is written here once, including saving.
+    """
+    import dsf_import_file_menu
+    importer = dsf_import_file_menu.DSF_loader(args.area[0], args.area[1], args.area[2], args.area[3], args.scaling,
+                                               args.overlay_per_terrain, args.engine, args.memory_budget, args.cells,
+                                               args.cache, args.workers, "", args.textures, args.proxy_size,
+                                               args.lod_distance, args.lod_objects, args.simplify_triangles, args.simplify_cell,
+                                               args.heightfield, args.incremental)
+    importer.profiler = dsf_profile.Profiler(True, args.trace_memory)
+    importer.execute_tiles(dsf_files)
+    if args.save:
+        with importer.profiler.stage("save blend"):
+            bpy.ops.wm.save_as_mainfile(filepath=os.path.abspath(args.save))
+        print("Saved {} in {:.3f}s".format(args.save, importer.profiler.stages["save blend"]["wall"]))
+    if args.report:
+        importer.profiler.write_json(args.report)
+        print("Written import report to {}".format(args.report))
+
+
+def main(argv):
+    args = parse_args(argv)
+    dsf_files = []
+    for path in args.dsf:
+        dsf_files.extend(dsf_extract.find_dsf_files(path))
+    if len(dsf_files) == 0:
+        print("ERROR: No dsf files found in: {}".format(" ".join(args.dsf)))
+        return 1
+    if bpy is None:
+        extract_files(args, dsf_files)
+    else:
+        import_files(args, dsf_files)
+    return 0
+
+
+if __name__ == "__main__":
+    if "--" in sys.argv:  # called from Blender, which passes arguments for the script after --
+        sys.exit(main(sys.argv[sys.argv.index("--") + 1:]))
+    else:
+        sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,949 @@
+# ******************************************************************************
+#
+# DSF2Blender: Python script for Blender that allows import of X-Plane DSF files
+#              Checked with Blender 3.0 but should work from 2.8 up
+#
+# For more details refer to GitHub: https://github.com/nofaceinbook/DSF2Blender
+#
+# WARNING: This code is still under development and may still have some errors.
+#
+# Copyright (C) 2022 by schmax (Max Schmidt)
+#
+# This code is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+# ******************************************************************************
+
+# Extraction of the triangles of a dsf file into arrays that are ready to be turned into Blender meshes.
+# This module does not use bpy, so it can also be used outside of Blender.
+# numpy is shipped with Blender, so nothing has to be installed in addition.
+
+import glob
+import os
+import weakref
+import numpy as np
+from dsf_profile import NO_PROFILER
+
+RASTER_ELEVATION = -32768  # elevation value of a vertex telling that the elevation has to be taken from the raster
+BYTES_PER_TRIANGLE = 400  # rough peak memory per triangle for extracted arrays and their temporaries
+TRANSFORM_BYTES_PER_VERTEX = 57  # memory per pool vertex of VertexTransform (keys, verts, normals, converted)
+MIN_BATCH_TRIANGLES = 10000  # triangles per batch when the memory budget is already used by the arrays of the tile
+SIMPLIFY_ITERATIONS = 6  # tries to find the cell size giving the triangle budget
+RASTER_POST_CENTRIC = 4  # raster flag: samples lie on the borders of the tile, otherwise in the center of their area
+RASTER_CHECK_POINTS = 64  # points where the raster sampled with numpy is compared with dsf.getVertexElevation
+RASTER_TOLERANCE = 0.001  # meter the elevations at the check points may differ
+RASTER_PROBE_SAMPLES = 4096  # samples of raster features where variants of sampling the raster are compared
+
+
+class VertexPools:
+    """
+    All vertex pools of dsf.V converted once into flat numpy arrays.
+    Vertex with index i in pool p is found at index offset[p] + i of the arrays.
+    """
+    def __init__(self, dsf):
+        self.offset = np.zeros(len(dsf.V) + 1, dtype=np.int64)
+        for p, pool in enumerate(dsf.V):
+            self.offset[p + 1] = self.offset[p] + len(pool)
+        n = int(self.offset[-1])
+
+        self.coords = np.zeros((n, 3), dtype=np.float64)  # lon, lat, elevation
+        self.normals = np.zeros((n, 2), dtype=np.float64)  # nx, ny of vertex normal
+        self.uvs = np.zeros((n, 4), dtype=np.float64)  # u, v and u2, v2 if given in pool
+        self.planes = np.zeros(n, dtype=np.int8)  # number of values per vertex in the pool
+
+        for p, pool in enumerate(dsf.V):
+            if len(pool) == 0:
+                continue
+            values = np.array(pool, dtype=np.float64)
+            s = slice(self.offset[p], self.offset[p + 1])
+            planes = values.shape[1]
+            self.planes[s] = planes
+            self.coords[s, :min(planes, 3)] = values[:, :3]
+            if planes >= 5:
+                self.normals[s] = values[:, 3:5]
+            if planes > 5:
+                self.uvs[s, :planes - 5] = values[:, 5:9]
+
+        self.transforms = dict()  # VertexTransform per tile origin and scaling
+
+    def __len__(self):
+        return int(self.offset[-1])
+
+    def transform(self, grid_west, grid_south, scaling):
+        """
+        Returns VertexTransform of the pool vertices for tile origin and scaling, creating it only with the first call.
+        """
+        if (grid_west, grid_south, scaling) not in self.transforms:
+            self.transforms[(grid_west, grid_south, scaling)] = VertexTransform(self, grid_west, grid_south, scaling)
+        return self.transforms[(grid_west, grid_south, scaling)]
+
+    def patch_corners(self, patch):
+        """
+        Returns for all triangles of the patch the indices of their three vertices in the flat arrays as (k, 3) array.
+        """
+        trias = patch.triangles()
+        if len(trias) == 0:
+            return np.zeros((0, 3), dtype=np.int64)
+        t = np.array(trias, dtype=np.int64)  # shape (k, 3, 2) with pool index and vertex index in pool
+        return self.offset[t[:, :, 0]] + t[:, :, 1]
+
+
+class VertexTransform:
+    """
+    Weld keys, Blender coordinates and normals of all pool vertices for one tile origin and scaling.
+    Keys and x, y are computed for all vertices at once. Elevation and normal are converted when a vertex is
+    used the first time, so the elevation of each pool vertex is looked up only once for all patches and batches.
+    """
+    def __init__(self, pools, grid_west, grid_south, scaling):
+        self.pools = pools
+        self.scaling = scaling
+        # coordinates rounded to 3 decimals are quantized to integers, so vertices are welded by integer keys
+        kx = np.rint((pools.coords[:, 0] - grid_west) * scaling * 1000).astype(np.int64)
+        ky = np.rint((pools.coords[:, 1] - grid_south) * scaling * 1000).astype(np.int64)
+        self.keys = vertex_keys(kx, ky)
+        self.verts = np.zeros((len(pools), 3), dtype=np.float64)
+        self.verts[:, 0] = kx / 1000
+        self.verts[:, 1] = ky / 1000
+        self.normals = np.zeros((len(pools), 3), dtype=np.float64)
+        self.converted = np.zeros(len(pools), dtype=bool)  # elevation and normal of vertex already converted
+
+    def convert(self, dsf, vertices):
+        """
+        Converts elevation and normal of the pool vertices (array of indices) that are not yet converted.
+        """
+        new = np.unique(vertices[~self.converted[vertices]])
+        if len(new) == 0:
+            return
+        vz = vertex_elevations(dsf, self.pools.coords[new])
+        self.verts[new, 2] = np.round(vz / (100000 / self.scaling), 3)  ### TBD: Make stretching of height configureable
+        nx = np.round(self.pools.normals[new, 0], 4)
+        ny = np.round(self.pools.normals[new, 1], 4)
+        self.normals[new, 0] = nx
+        self.normals[new, 1] = ny
+        self.normals[new, 2] = np.round(np.sqrt(np.clip(1 - nx * nx - ny * ny, 0, None)), 4)
+        self.converted[new] = True
+
+
+class PatchIndex:
+    """
+    Triangle corners (indices into VertexPools) and bounding box (west, east, south, north) of every patch.
+    Built once per dsf, so that patches outside an area can be skipped without looking at their triangles.
+    """
+    def __init__(self, dsf, pools):
+        self.corners = dict()  # id of patch as key and (k, 3) array of triangle corners as value
+        self.bounds = dict()  # id of patch as key and bounding box as value; None for patches without triangles
+        for p in dsf.Patches:
+            corners = pools.patch_corners(p)
+            self.corners[id(p)] = corners.astype(np.int32) if len(pools) < 2**31 else corners
+            if len(corners):
+                lon = pools.coords[corners, 0]
+                lat = pools.coords[corners, 1]
+                self.bounds[id(p)] = (lon.min(), lon.max(), lat.min(), lat.max())
+            else:
+                self.bounds[id(p)] = None
+
+    def area_test(self, patch, area):
+        """
+        Returns -1 if patch is completely outside area (west, east, south, north), 1 if it is completely inside
+        and 0 if triangles of the patch have to be tested.
+        """
+        bounds = self.bounds[id(patch)]
+        if bounds is None:
+            return -1
+        west, east, south, north = bounds
+        if east < area[0] or west > area[1] or north < area[2] or south > area[3]:
+            return -1
+        if area[0] <= west and east <= area[1] and area[2] <= south and north <= area[3]:
+            return 1
+        return 0
+
+
+_dsf_arrays = weakref.WeakKeyDictionary()  # VertexPools and PatchIndex per dsf already converted
+
+
+def dsf_arrays(dsf):
+    """
+    Returns VertexPools and PatchIndex for the dsf, converting it only with the first call.
+    """
+    if dsf not in _dsf_arrays:
+        pools = VertexPools(dsf)
+        _dsf_arrays[dsf] = (pools, PatchIndex(dsf, pools))
+    return _dsf_arrays[dsf]
+
+
+def budget_triangles(dsf, memory_budget, profiler=NO_PROFILER):
+    """
+    Returns max_triangles per batch for extract_batches, so that the extraction stays within memory_budget MB.
+    The arrays kept for the whole tile (VertexPools, PatchIndex and VertexTransform) are taken from the budget
+    first, the rest is divided by BYTES_PER_TRIANGLE of the batches. Memory budget 0 returns 0 (no streaming).
+    """
+    if not memory_budget:
+        return 0
+    with profiler.stage("extract triangles/vertex pools"):
+        pools, index = dsf_arrays(dsf)
+    tile_bytes = (pools.offset.nbytes + pools.coords.nbytes + pools.normals.nbytes + pools.uvs.nbytes + pools.planes.nbytes
+                  + sum(c.nbytes for c in index.corners.values()) + len(pools) * TRANSFORM_BYTES_PER_VERTEX)
+    batch_bytes = memory_budget * 1024 * 1024 - tile_bytes
+    if batch_bytes < MIN_BATCH_TRIANGLES * BYTES_PER_TRIANGLE:
+        print("WARNING: Memory budget of {} MB is used by the {:.0f} MB of arrays for the whole tile, extracting batches of {} triangles".format(
+            memory_budget, tile_bytes / (1024 * 1024), MIN_BATCH_TRIANGLES))
+        return MIN_BATCH_TRIANGLES
+    return batch_bytes // BYTES_PER_TRIANGLE
+
+
+def sort_patches(dsf):
+    """
+    Returns dict with terrain layer id (flag, terrain definition index, near, far) as key and list of patches as value.
+    """
+    # SORT mesh patches so that pyhiscal mesh is bottom layer and all overlys are above
+    # All layers sorted based on the flag and id of terrain in list, so that they will get higher z-value to avoid same z-layer artefacts
+    # Also sort by near and far values to store them later in material name
+    # In addition this sorting allows to switch materials with every layer
+    ######## TBD: Give option to avoid loading of overlays
+    ter_layers = dict()
+    for p in dsf.Patches:
+        ter_type = (p.flag, p.defIndex, p.near, p.far)
+        if ter_type in ter_layers:
+            ter_layers[ter_type].append(p)
+        else:
+            ter_layers[ter_type] = [p]
+    return ter_layers
+
+
+def visible_layers(ter_layers, distance):
+    """
+    Returns ter_layers with only the terrain layers whose patches are shown at view distance in meters.
+    Patches are shown from their near to far distance, far below 0 is without limit.
+    With distance below 0 all terrain layers are returned.
+    """
+    if distance < 0:
+        return ter_layers
+    return {t: patches for t, patches in ter_layers.items() if t[2] <= distance and (t[3] < 0 or distance <= t[3])}
+
+
+def tile_area(area, grid_west, grid_south):
+    """
+    Returns area (west, east, south, north) in absolute coordinates. Area from 0 to 1 is relative to the tile.
+    """
+    area_w, area_e, area_s, area_n = area
+    if 0 <= area_w <= 1 and 0 <= area_s <= 1:
+        return area_w + grid_west, area_e + grid_west, area_s + grid_south, area_n + grid_south
+    return area
+
+
+def find_dsf_files(path):
+    """
+    Returns sorted list of dsf files in directory path, e.g. a scenery folder with 'Earth nav data/*/*.dsf',
+    a folder of 'Earth nav data' or the 10x10 degree folder. A path to a dsf file is returned as only file.
+    """
+    if os.path.isfile(path):
+        return [path]
+    files = set()
+    for pattern in ("*.dsf", os.path.join("*", "*.dsf"), os.path.join("Earth nav data", "*", "*.dsf")):
+        files.update(glob.glob(os.path.join(path, pattern)))
+    return sorted(files)
+
+
+def read_tile(dsf_file):
+    """
+    Reads dsf_file and returns the XPLNEDSF object.
+    """
+    from xplnedsf2 import XPLNEDSF  # only needed here, so the other functions can be used without xplnedsf2
+    dsf = XPLNEDSF()
+    dsf.read(dsf_file)
+    return dsf
+
+
+def extract_tile(dsf_file, area, scaling, layer_per_overlay, lod_distance=-1):
+    """
+    Reads and extracts a complete dsf file, e.g. in a worker process.
+    Area is given like for the import as relative or absolute coordinates.
+    With lod_distance of 0 or more only patches shown at this distance are extracted.
+    Returns west, south, terrain definitions and the extracted arrays as returned by extract_mesh.
+    """
+    dsf = read_tile(dsf_file)
+    grid_west = int(dsf.Properties["sim/west"])
+    grid_south = int(dsf.Properties["sim/south"])
+    area = tile_area(area, grid_west, grid_south)
+    ter_layers = visible_layers(sort_patches(dsf), lod_distance)
+    extracted = extract_mesh(dsf, ter_layers, grid_west, grid_south, area, scaling, layer_per_overlay)
+    return grid_west, grid_south, dict(dsf.DefTerrains), extracted
+
+
+def heightfield_tile(dsf_file, area, scaling, resolution, profiler=NO_PROFILER):
+    """
+    Reads a complete dsf file and returns west, south and the heightfield (see heightfield) of area with
+    resolution x resolution grid squares. Area is given like for the import as relative or absolute coordinates.
+    """
+    with profiler.stage("read dsf"):
+        dsf = read_tile(dsf_file)
+    grid_west = int(dsf.Properties["sim/west"])
+    grid_south = int(dsf.Properties["sim/south"])
+    area = tile_area(area, grid_west, grid_south)
+    with profiler.stage("heightfield/elevations", (resolution + 1) ** 2):
+        elevations = grid_elevations(dsf, area, resolution)
+    with profiler.stage("heightfield/mesh", 2 * resolution ** 2):
+        return (grid_west, grid_south) + heightfield(elevations, area, grid_west, grid_south, scaling)
+
+
+def grid_elevations(dsf, area, resolution):
+    """
+    Returns (resolution + 1, resolution + 1) array of elevations in meter at the points of a regular grid
+    covering area (absolute west, east, south, north) with index [x][y].
+    Elevations are sampled from the raster of the dsf with RasterSampler like by dsf.getVertexElevation.
+    Without raster the elevations of the vertices are averaged at their nearest grid point and grid points
+    without vertex get the elevation of their neighbours.
+    The triangles of the patches are not used.
+    """
+    grid_west = int(dsf.Properties["sim/west"])
+    grid_south = int(dsf.Properties["sim/south"])
+    raster = dsf_raster(dsf)
+    if raster is not None:
+        x, y = np.meshgrid(np.linspace(area[0], area[1], resolution + 1) - grid_west,
+                           np.linspace(area[2], area[3], resolution + 1) - grid_south, indexing="ij")
+        return raster.sample(x, y)
+
+    coords = VertexPools(dsf).coords
+    coords = coords[coords[:, 2] != RASTER_ELEVATION]
+    column = np.rint((coords[:, 0] - area[0]) / (area[1] - area[0]) * resolution).astype(np.int64)
+    row = np.rint((coords[:, 1] - area[2]) / (area[3] - area[2]) * resolution).astype(np.int64)
+    inside = (column >= 0) & (column <= resolution) & (row >= 0) & (row <= resolution)
+    points = column[inside] * (resolution + 1) + row[inside]
+    sums = np.bincount(points, weights=coords[inside, 2], minlength=(resolution + 1) ** 2)
+    counts = np.bincount(points, minlength=(resolution + 1) ** 2)
+    grid = np.full((resolution + 1) ** 2, np.nan)
+    grid[counts > 0] = sums[counts > 0] / counts[counts > 0]
+    return fill_grid(grid.reshape(resolution + 1, resolution + 1))
+
+
+def fill_grid(grid):
+    """
+    Returns copy of grid where NaN values are filled with the mean of their known neighbours, repeated until all
+    values are known. Without any known value the grid is filled with 0.
+    """
+    grid = grid.copy()
+    if np.isnan(grid).all():
+        grid[:] = 0.0
+    while np.isnan(grid).any():
+        known = ~np.isnan(grid)
+        values = np.pad(np.where(known, grid, 0.0), 1)
+        weights = np.pad(known.astype(np.float64), 1)
+        sums = values[:-2, 1:-1] + values[2:, 1:-1] + values[1:-1, :-2] + values[1:-1, 2:]
+        counts = weights[:-2, 1:-1] + weights[2:, 1:-1] + weights[1:-1, :-2] + weights[1:-1, 2:]
+        fill = ~known & (counts > 0)
+        grid[fill] = sums[fill] / counts[fill]
+    return grid
+
+
+def heightfield(elevations, area, grid_west, grid_south, scaling):
+    """
+    Returns verts, normals, faces and uvs per triangle corner of a mesh for the grid of elevations (see
+    grid_elevations) covering area, with two triangles per grid square and in the Blender coordinates of the
+    extracted meshes. Uvs go from 0 to 1 over the area.
+    """
+    nx, ny = elevations.shape
+    x, y = np.meshgrid((np.linspace(area[0], area[1], nx) - grid_west) * scaling,
+                       (np.linspace(area[2], area[3], ny) - grid_south) * scaling, indexing="ij")
+    z = elevations / (100000 / scaling)  ### TBD: Make stretching of height configureable
+    verts = np.column_stack((x.ravel(), y.ravel(), z.ravel()))
+
+    # normals from the slope of the grid
+    gx, gy = np.gradient(z, x[:, 0], y[0, :])
+    normals = np.column_stack((-gx.ravel(), -gy.ravel(), np.ones(z.size)))
+    normals /= np.linalg.norm(normals, axis=1)[:, np.newaxis]
+
+    i, j = np.meshgrid(np.arange(nx - 1), np.arange(ny - 1), indexing="ij")
+    a = (i * ny + j).ravel()
+    faces = np.concatenate((np.column_stack((a, a + ny, a + ny + 1)), np.column_stack((a, a + ny + 1, a + 1))))
+    grid_uvs = np.column_stack(((np.arange(nx * ny) // ny) / (nx - 1), (np.arange(nx * ny) % ny) / (ny - 1)))
+    return verts, normals, faces, grid_uvs[faces]
+
+
+def raster_positions(x, size, post_centric):
+    """
+    Returns the positions in a raster axis with size samples for x relative to the tile (0 to 1).
+    Post-centric samples lie on the borders of the tile, area-centric ones in the center of their area.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    if post_centric:
+        return np.clip(x * (size - 1), 0, size - 1)
+    return np.clip(x * size - 0.5, 0, size - 1)
+
+
+def interpolate_raster(raster, px, py, interpolation="bilinear"):
+    """
+    Returns the values of raster (array with index [x][y]) at the raster positions px, py (see raster_positions),
+    "bilinear" interpolated, of the "nearest" sample or of the sample at the positions cut to integer ("floor").
+    """
+    width, height = raster.shape
+    if interpolation == "nearest":
+        return raster[np.rint(px).astype(np.int64), np.rint(py).astype(np.int64)]
+    if interpolation == "floor":
+        return raster[px.astype(np.int64), py.astype(np.int64)]
+    x0 = np.minimum(px.astype(np.int64), max(width - 2, 0))
+    y0 = np.minimum(py.astype(np.int64), max(height - 2, 0))
+    x1 = np.minimum(x0 + 1, width - 1)
+    y1 = np.minimum(y0 + 1, height - 1)
+    fx = px - x0
+    fy = py - y0
+    return (raster[x0, y0] * (1 - fx) + raster[x1, y0] * fx) * (1 - fy) + (raster[x0, y1] * (1 - fx) + raster[x1, y1] * fx) * fy
+
+
+def raster_probes(raster):
+    """
+    Returns (n, 2) array of points relative to the tile (0 to 1) where variants of sampling the raster differ:
+    at and between the samples that differ from a neighbour, for index [x][y] and [y][x] and both positions of
+    the samples (see raster_positions). At most RASTER_PROBE_SAMPLES samples are used.
+    """
+    changes = np.zeros(raster.shape, dtype=bool)
+    changes[1:, :] |= raster[1:, :] != raster[:-1, :]
+    changes[:-1, :] |= raster[1:, :] != raster[:-1, :]
+    changes[:, 1:] |= raster[:, 1:] != raster[:, :-1]
+    changes[:, :-1] |= raster[:, 1:] != raster[:, :-1]
+    i, j = np.nonzero(changes)
+    if len(i) > RASTER_PROBE_SAMPLES:
+        chosen = np.sort(np.random.default_rng(0).choice(len(i), RASTER_PROBE_SAMPLES, replace=False))
+        i, j = i[chosen], j[chosen]
+    probes = []
+    for (a, size_a), (b, size_b) in (((i, raster.shape[0]), (j, raster.shape[1])), ((j, raster.shape[1]), (i, raster.shape[0]))):
+        for post_centric in (True, False):
+            for da in (0.0, 0.25, 0.75):  # between samples bilinear, nearest and floor differ
+                for db in (0.0, 0.25, 0.75):
+                    if post_centric:
+                        probes.append(np.column_stack(((a + da) / max(size_a - 1, 1), (b + db) / max(size_b - 1, 1))))
+                    else:
+                        probes.append(np.column_stack(((a + da + 0.5) / size_a, (b + db + 0.5) / size_b)))
+    return np.clip(np.concatenate(probes), 0.0, 1.0)
+
+
+class RasterSampler:
+    """
+    Elevation raster of a dsf, sampled with numpy for many points at once like dsf.getVertexElevation.
+    How the raster data is stored and sampled depends on xplnedsf2 (index [x][y] or [y][x], scale and offset
+    already applied or not, interpolated or nearest sample, position of samples by the raster flags or not).
+    So the variants giving the same elevations as getVertexElevation at RASTER_CHECK_POINTS points are kept.
+    On flat tiles several variants fit, so they are also checked where they differ near the features of the
+    raster, until one is left or the rest give the same elevations there.
+    If no variant fits, elevations are looked up point by point with getVertexElevation.
+    """
+    def __init__(self, dsf):
+        self.dsf = dsf
+        self.west = int(dsf.Properties["sim/west"])
+        self.south = int(dsf.Properties["sim/south"])
+        self.variant = None  # raster as [x][y] array, post-centric and interpolation giving the elevations of the dsf
+        r = dsf.Raster[0]
+        data = np.asarray(r.data, dtype=np.float64)
+        layouts = []
+        if data.shape == (r.width, r.height):
+            layouts.append(data)
+        if data.shape == (r.height, r.width):  # rows from south to north as stored in the dsf
+            layouts.append(data.T)
+        if data.ndim == 1 and data.size == r.width * r.height:
+            layouts += [data.reshape(r.width, r.height), data.reshape(r.height, r.width).T]
+        post_centric = bool(getattr(r, "flags", 0) & RASTER_POST_CENTRIC)
+        scale = getattr(r, "scale", 1.0) or 1.0
+        offset = getattr(r, "offset", 0.0) or 0.0
+        variants = [(values, centric, interpolation) for raster in layouts
+                    for values in ((raster, raster * scale + offset) if (scale, offset) != (1.0, 0.0) else (raster,))
+                    for centric in (post_centric, not post_centric) for interpolation in ("bilinear", "nearest", "floor")]
+
+        points = np.random.default_rng(0).random((RASTER_CHECK_POINTS, 2))
+        points[:4] = [[0.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.5, 0.5]]
+        variants = self.matching(variants, points)
+        probes = raster_probes(layouts[0]) if len(variants) > 1 else None
+        while len(variants) > 1:
+            samples = np.array([self.interpolate(v, probes[:, 0], probes[:, 1]) for v in variants])
+            spread = samples.max(axis=0) - samples.min(axis=0)
+            differ = np.flatnonzero(spread > 2 * RASTER_TOLERANCE)  # at least one variant does not fit there
+            if len(differ) == 0:
+                break  # remaining variants give the same elevations at all features of the raster
+            check = differ[np.argsort(-spread[differ], kind="stable")[:RASTER_CHECK_POINTS]]
+            variants = self.matching(variants, probes[check])
+            probes = np.delete(probes, check, axis=0)
+        if len(variants):
+            self.variant = variants[0]
+        else:
+            print("WARNING: Raster of dsf can not be sampled like getVertexElevation, looking up elevations one by one")
+
+    def matching(self, variants, points):
+        """
+        Returns the variants giving the same elevations as getVertexElevation at the (n, 2) points relative to the tile.
+        """
+        expected = self.lookup(points[:, 0], points[:, 1])
+        return [v for v in variants
+                if np.allclose(self.interpolate(v, points[:, 0], points[:, 1]), expected, rtol=0, atol=RASTER_TOLERANCE)]
+
+    @staticmethod
+    def interpolate(variant, x, y):
+        """
+        Returns elevations of variant (raster, post-centric, interpolation) at x, y relative to the tile (0 to 1).
+        """
+        values, centric, interpolation = variant
+        return interpolate_raster(values, raster_positions(x, values.shape[0], centric),
+                                  raster_positions(y, values.shape[1], centric), interpolation)
+
+    def lookup(self, x, y):
+        """
+        Returns elevations at x, y relative to the tile (0 to 1) from dsf.getVertexElevation, one point after the other.
+        """
+        return np.array([self.dsf.getVertexElevation(self.west + a, self.south + b, RASTER_ELEVATION)
+                         for a, b in zip(np.ravel(x).tolist(), np.ravel(y).tolist())], dtype=np.float64).reshape(np.shape(x))
+
+    def sample(self, x, y):
+        """
+        Returns elevations at x, y relative to the tile (0 to 1), which are arrays of the same shape.
+        """
+        if self.variant is None:
+            return self.lookup(x, y)
+        return self.interpolate(self.variant, x, y)
+
+
+_rasters = weakref.WeakKeyDictionary()  # RasterSampler per dsf already created
+
+
+def dsf_raster(dsf):
+    """
+    Returns RasterSampler for the dsf, creating it only with the first call, or None if the dsf has no raster.
+    """
+    if dsf not in _rasters:
+        _rasters[dsf] = RasterSampler(dsf) if len(dsf.Raster) else None
+    return _rasters[dsf]
+
+
+def vertex_elevations(dsf, coords):
+    """
+    Returns elevation for the given (n, 3) array of lon, lat, elevation.
+    Only vertices with elevation RASTER_ELEVATION are looked up from the raster of the dsf, all at once with
+    RasterSampler. Without raster they are looked up one by one with dsf.getVertexElevation.
+    """
+    elevations = coords[:, 2].copy()
+    lookup = np.flatnonzero(elevations == RASTER_ELEVATION)
+    if len(lookup) == 0:
+        return elevations
+    raster = dsf_raster(dsf)
+    if raster is not None:
+        elevations[lookup] = raster.sample(coords[lookup, 0] - raster.west, coords[lookup, 1] - raster.south)
+        return elevations
+    for i in lookup.tolist():
+        elevations[i] = dsf.getVertexElevation(coords[i, 0], coords[i, 1], coords[i, 2])
+    return elevations
+
+
+def vertex_keys(kx, ky):
+    """
+    Returns one int64 key per vertex from the quantized coordinates kx, ky (integer arrays of same shape).
+    Quantized coordinates must be in the range of int32.
+    """
+    return (kx.astype(np.int64) << 32) + (ky.astype(np.int64) + 2**31)
+
+
+def weld(keys):
+    """
+    Welds the vertices given by one key per triangle corner (e.g. from vertex_keys).
+    Returns for each corner the index of its vertex and for each vertex the position of its first corner.
+    Vertices are numbered in the order of their first appearance, like adding them to a dict one after the other.
+    """
+    unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty(len(unique_keys), dtype=np.int64)
+    rank[order] = np.arange(len(unique_keys))
+    return rank[inverse.reshape(-1)], first[order]
+
+
+def triangle_layers(vi):
+    """
+    Returns for each triangle (rows of vertex indices vi) the number of equal triangles before it, which is its layer.
+    Triangles are equal if they have the same vertices in the same winding, starting with any of them.
+    """
+    if len(vi) == 0:
+        return np.zeros(0, dtype=np.int64)
+    # rotate each tria so that smallest index is first, but keep winding of tria
+    smallest_index = vi.min(axis=1)
+    rotation = np.where(vi[:, 1] == smallest_index, 1, np.where(vi[:, 2] == smallest_index, 2, 0))
+    ti_match = np.take_along_axis(vi, (rotation[:, None] + np.arange(3)) % 3, axis=1).astype(np.int64)
+
+    # sort equal trias next to each other keeping their order, then count position inside each group of equal trias
+    if ti_match.max() < 2**21:  # all three indices fit into one int64 key
+        order = np.argsort((ti_match[:, 0] << 42) | (ti_match[:, 1] << 21) | ti_match[:, 2], kind="stable")
+    else:
+        order = np.lexsort((ti_match[:, 2], ti_match[:, 1], ti_match[:, 0]))
+    ti_match = ti_match[order]
+    position = np.arange(len(vi))
+    group_start = np.zeros(len(vi), dtype=np.int64)
+    new_group = np.flatnonzero((ti_match[1:] != ti_match[:-1]).any(axis=1)) + 1
+    group_start[new_group] = new_group
+    np.maximum.accumulate(group_start, out=group_start)
+    layers = np.empty(len(vi), dtype=np.int64)
+    layers[order] = position - group_start
+    return layers
+
+
+class LayerCollector:
+    """
+    Collects the extracted triangles of the patches until they are welded and sorted into layers as final arrays.
+    Welding is done once for all collected triangles when the result is requested.
+    """
+    def __init__(self, dsf, transform, profiler=NO_PROFILER):
+        self.dsf = dsf
+        self.transform = transform
+        self.profiler = profiler
+        self.patches = []  # per patch layer (None for layer per triangle), ter_layer_id, corners, keys, uvs, uvs2
+        self.n_trias = 0
+
+    def add(self, layer, ter_layer_id, corners, keys, tuvs, tuvs2):
+        """
+        Adds triangles with corners (indices into the vertex pools) and their vertex keys to layer using material of
+        ter_layer_id. Corners and keys are in dsf winding, uvs per corner already in Blender winding.
+        With layer None the layer of each triangle is set by how many triangles are below it.
+        """
+        self.patches.append((layer, ter_layer_id, corners, keys, tuvs, tuvs2))
+        self.n_trias += len(corners)
+
+    def result(self):
+        """
+        Returns verts, normals, faces, uvs, uvs2, materials, matIndexPerTria, used_materials with numpy arrays.
+        """
+        with self.profiler.stage("extract triangles/weld", self.n_trias):
+            if self.patches:
+                keys = np.concatenate([p[3].reshape(-1) for p in self.patches])
+                all_vi, first = weld(keys)
+                del keys
+                new_vertices = np.concatenate([p[2].reshape(-1) for p in self.patches])[first]
+                self.transform.convert(self.dsf, new_vertices)
+                verts = self.transform.verts[new_vertices]
+                normals = self.transform.normals[new_vertices]
+            else:
+                all_vi = np.zeros((0, 3), dtype=np.int64)
+                verts = np.zeros((0, 3), dtype=np.float64)
+                normals = np.zeros((0, 3), dtype=np.float64)
+
+        # winding in Blender is just opposite as in X-Plane, so all corner values are reversed
+        all_vi = all_vi.reshape(-1, 3)[:, ::-1]
+        if any(p[0] is None for p in self.patches):
+            with self.profiler.stage("extract triangles/layer assignment", len(all_vi)):
+                all_layers = triangle_layers(all_vi)  # tria existing already is put on next layer above
+
+        layers = LayerArrays()
+        start = 0
+        for layer, ter_layer_id, corners, keys, tuvs, tuvs2 in self.patches:
+            vi = all_vi[start:start + len(corners)]
+            if layer is None:
+                tria_layers = all_layers[start:start + len(corners)]
+                for l in np.unique(tria_layers).tolist():
+                    trias = np.flatnonzero(tria_layers == l)
+                    layers.add(l, ter_layer_id, vi[trias], tuvs[trias], tuvs2[trias])
+            else:
+                layers.add(layer, ter_layer_id, vi, tuvs, tuvs2)
+            start += len(corners)
+        return (verts, normals) + layers.result()
+
+
+class LayerArrays:
+    """
+    Triangles sorted per layer together with the materials used per layer.
+    """
+    def __init__(self):
+        self.materials = []  # list containing all information for all materials for all layers used
+        self.used_materials = [[]]  # list containing for each layer the used materials
+        self.faces = [[]]  # per layer list of face arrays of the patches, concatenated at the end
+        self.uvs = [[]]
+        self.uvs2 = [[]]
+        self.mats = [[]]
+
+    def add(self, layer, ter_layer_id, vi, tuvs, tuvs2):
+        """
+        Adds triangles with vertex indices vi and uvs per corner to layer using material of ter_layer_id.
+        """
+        if len(self.materials) == 0 or ter_layer_id != self.materials[-1]:  # materials are sorted, so just check the end
+            self.materials.append(ter_layer_id)
+        mat_id = len(self.materials) - 1
+        while layer >= len(self.faces):  # We need additional layer so extend lists
+            self.faces.append([])
+            self.uvs.append([])
+            self.uvs2.append([])
+            self.mats.append([])
+            self.used_materials.append([])
+        if len(self.used_materials[layer]) == 0 or mat_id != self.used_materials[layer][-1]:
+            self.used_materials[layer].append(mat_id)
+        self.faces[layer].append(vi)
+        self.uvs[layer].append(tuvs.reshape(-1, 2))
+        self.uvs2[layer].append(tuvs2.reshape(-1, 2))
+        self.mats[layer].append(np.full(len(vi), len(self.used_materials[layer]) - 1, dtype=np.int32))
+
+    def result(self):
+        """
+        Returns faces, uvs, uvs2, materials, matIndexPerTria, used_materials with numpy arrays per layer.
+        """
+        faces = [_concat(f, (0, 3), np.int64) for f in self.faces]
+        uvs = [_concat(u, (0, 2), np.float64) for u in self.uvs]
+        uvs2 = [_concat(u, (0, 2), np.float64) for u in self.uvs2]
+        matIndexPerTria = [_concat(m, (0,), np.int32) for m in self.mats]
+        return faces, uvs, uvs2, self.materials, matIndexPerTria, self.used_materials
+
+
+def extract_mesh(dsf, ter_layers, grid_west, grid_south, area, scaling, layer_per_overlay, profiler=NO_PROFILER):
+    """
+    Extracts all triangles of the patches in ter_layers (dict with terrain layer id as key and list of patches
+    as value) which have at least one vertex in area (west, east, south, north).
+    Does the same as the loop in DSF_loader.execute but works on numpy arrays per patch.
+    Returns verts, normals, faces, uvs, uvs2, materials, matIndexPerTria, used_materials where the values
+    per layer (faces, uvs, uvs2 and matIndexPerTria) are numpy arrays.
+    Parts of the extraction are recorded by profiler (see dsf_profile.py).
+    """
+    for result in extract_batches(dsf, ter_layers, grid_west, grid_south, area, scaling, layer_per_overlay, profiler=profiler):
+        return result
+
+
+def extract_batches(dsf, ter_layers, grid_west, grid_south, area, scaling, layer_per_overlay, max_triangles=0, profiler=NO_PROFILER):
+    """
+    Generator doing the extraction of extract_mesh. With max_triangles = 0 everything is returned as one batch.
+    Otherwise a batch is returned each time max_triangles are extracted and after each overlay terrain, so that
+    the caller can create the meshes and free the data before the next batch is extracted.
+    As vertices are only welded inside a batch, streaming always uses one layer per overlay terrain.
+    The layer numbers are kept over all batches, so layers of earlier batches are empty in later ones.
+    """
+    area_w, area_e, area_s, area_n = area
+    with profiler.stage("extract triangles/vertex pools"):
+        pools, index = dsf_arrays(dsf)
+    with profiler.stage("extract triangles/vertex transform"):
+        transform = pools.transform(grid_west, grid_south, scaling)
+    if max_triangles:
+        layer_per_overlay = True
+    collector = LayerCollector(dsf, transform, profiler)
+    layer = -1
+
+    for ter_layer_id in sorted(ter_layers.keys()):
+        water = (dsf.DefTerrains[ter_layer_id[1]] == "terrain_Water")
+        if layer_per_overlay:
+            if ter_layer_id[0] == 1:  # for basemesh we use layer 0
+                layer = 0
+            else:
+                layer += 1  # this requires that there was base-mesh before setting layer=0
+        for p in ter_layers[ter_layer_id]:
+            area_test = index.area_test(p, area)
+            if area_test < 0:  # no vertex of patch inside area
+                continue
+            corners = index.corners[id(p)]
+            # if water is projected depends if uv coordinates are given or not, taken from first vertex in first tria
+            projected_uv = water and pools.planes[corners[0, 0]] <= 5
+
+            lon = pools.coords[corners, 0]
+            lat = pools.coords[corners, 1]
+            if area_test == 0:  # patch partly in area, so keep trias with at least one vertex inside
+                inside = (area_w <= lon) & (lon <= area_e) & (area_s <= lat) & (lat <= area_n)
+                keep = inside.any(axis=1)
+                corners = corners[keep]
+                lon = lon[keep]
+                lat = lat[keep]
+                if len(corners) == 0:
+                    continue
+
+            profiler.count("extract triangles", len(corners))
+            keys = transform.keys[corners]
+
+            # winding in Blender is just opposite as in X-Plane, so all corner values for uvs are reversed
+            rcorners = corners[:, ::-1]
+            vx = transform.verts[rcorners, 0]
+            vy = transform.verts[rcorners, 1]
+
+            planes = pools.planes[rcorners]
+            own_uv = np.stack((vx / 100, vy / 100), axis=-1)  # By this definition uvs exceed [0;1] range, but should lead to scale 10 times the size
+            tuvs = own_uv.copy()
+            tuvs2 = own_uv.copy()
+            first_uv = pools.uvs[rcorners, 0:2]
+            second_uv = pools.uvs[rcorners, 2:4]
+            p7 = (planes == 7)
+            if not projected_uv and p.flag == 1:  # for projected physical mesh; for overlay we would need second uvs for border
+                tuvs[p7] = first_uv[p7]
+            else:  # should only be the case if projected and we have overlay to get uv-map for border
+                tuvs2[p7] = first_uv[p7]
+            p9 = (planes == 9)  # first uvs for mesh 2nd for border
+            tuvs[p9] = first_uv[p9]
+            tuvs2[p9] = second_uv[p9]
+
+            ### Identify layer for material, without layer per overlay done per triangle when collected triangles are welded ###
+            collector.add(layer if layer_per_overlay else None, ter_layer_id, corners, keys, tuvs, tuvs2)
+
+            if max_triangles and collector.n_trias >= max_triangles:
+                yield collector.result()
+                collector = LayerCollector(dsf, transform, profiler)
+
+        if max_triangles and ter_layer_id[0] > 1 and collector.n_trias:  # each overlay terrain is own batch
+            yield collector.result()
+            collector = LayerCollector(dsf, transform, profiler)
+
+    if collector.n_trias or not max_triangles:
+        yield collector.result()
+
+
+def cell_buckets(verts, faces, cells, bounds):
+    """
+    Sorts the triangles (faces indexing verts) by their center into a grid of cells x cells over
+    bounds (x_min, x_max, y_min, y_max). Triangles with center outside bounds go to the nearest border cell.
+    Returns list of (column, row, tria indices) for each cell containing triangles.
+    """
+    x_min, x_max, y_min, y_max = bounds
+    center = verts[faces].mean(axis=1)
+    column = np.floor((center[:, 0] - x_min) / (x_max - x_min) * cells).astype(np.int64)
+    row = np.floor((center[:, 1] - y_min) / (y_max - y_min) * cells).astype(np.int64)
+    cell = np.clip(row, 0, cells - 1) * cells + np.clip(column, 0, cells - 1)
+
+    order = np.argsort(cell, kind="stable")  # bucket index: trias of each cell follow each other keeping their order
+    counts = np.bincount(cell, minlength=cells * cells)
+    ends = np.cumsum(counts)
+    buckets = []
+    for c in np.flatnonzero(counts).tolist():
+        buckets.append((c % cells, c // cells, order[ends[c] - counts[c]:ends[c]]))
+    return buckets
+
+
+def compact_vertices(verts, normals, faces):
+    """
+    Returns verts, normals and faces with only the vertices used by faces (delete loose vertices).
+    Vertices keep their order and faces are renumbered. If all vertices are used, the arrays are not copied.
+    """
+    verts = np.asarray(verts).reshape(-1, 3)
+    normals = np.asarray(normals).reshape(-1, 3)
+    faces = np.asarray(faces).reshape(-1, 3)
+    used = np.zeros(len(verts), dtype=bool)
+    used[faces.ravel()] = True
+    if used.all():
+        return verts, normals, faces
+    new_index = np.cumsum(used) - 1
+    return verts[used], normals[used], new_index[faces]
+
+
+def verts_keys(verts):
+    """
+    Returns vertex_keys of the extracted vertices (n, 3), same as the keys they were welded with.
+    """
+    verts = np.asarray(verts).reshape(-1, 3)
+    return vertex_keys(np.rint(verts[:, 0] * 1000).astype(np.int64), np.rint(verts[:, 1] * 1000).astype(np.int64))
+
+
+def tile_overlay_keys(dsf, ter_layers, grid_west, grid_south, area, scaling):
+    """
+    Returns sorted array of the vertex keys of all overlay triangles (flag > 1) extract_batches extracts from the tile.
+    When streaming, overlays are in other batches than the basemesh, so these keys tell the vertices of the
+    basemesh that are used by overlays.
+    """
+    pools, index = dsf_arrays(dsf)
+    transform = pools.transform(grid_west, grid_south, scaling)
+    keys = [np.zeros(0, dtype=np.int64)]
+    for ter_layer_id, patches in ter_layers.items():
+        if ter_layer_id[0] == 1:
+            continue
+        for p in patches:
+            area_test = index.area_test(p, area)
+            if area_test < 0:
+                continue
+            corners = index.corners[id(p)]
+            if area_test == 0:
+                lon = pools.coords[corners, 0]
+                lat = pools.coords[corners, 1]
+                corners = corners[((area[0] <= lon) & (lon <= area[1]) & (area[2] <= lat) & (lat <= area[3])).any(axis=1)]
+            keys.append(transform.keys[corners.ravel()])
+    return np.unique(np.concatenate(keys))
+
+
+def batches_overlay_keys(batches):
+    """
+    Returns sorted array of the vertex keys of all vertices used by overlays (layers > 0) in the extracted batches,
+    like tile_overlay_keys but e.g. for batches read from the cache.
+    """
+    keys = [np.zeros(0, dtype=np.int64)]
+    for extracted in batches:
+        verts = np.asarray(extracted[0]).reshape(-1, 3)
+        keys += [verts_keys(verts[np.unique(np.asarray(layer_faces).ravel())]) for layer_faces in extracted[2][1:]]
+        del extracted, verts  # free the batch before the next one is loaded
+    return np.unique(np.concatenate(keys))
+
+
+def boundary_vertices(faces):
+    """
+    Returns the vertices on the border of the mesh (faces), i.e. of edges used by only one triangle.
+    """
+    m = int(faces.max()) + 1
+    edges = np.sort(np.concatenate((faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]])), axis=1).astype(np.int64)
+    edge_keys, counts = np.unique(edges[:, 0] * m + edges[:, 1], return_counts=True)
+    border = edge_keys[counts == 1]
+    return np.unique(np.concatenate((border // m, border % m)))
+
+
+def simplify_mesh(verts, faces, keep_vertices, max_triangles=0, cell_size=0.0):
+    """
+    Simplifies mesh by clustering its vertices in a grid of cells with cell_size or, with cell_size 0, with cells
+    giving at most about max_triangles triangles. All vertices in a cell are merged into the first of them.
+    Vertices on the border of the mesh (e.g. tile border) and keep_vertices (e.g. used by overlays) are not merged.
+    Returns indices of the remaining triangles and their faces using the merged vertices.
+    """
+    verts = np.asarray(verts).reshape(-1, 3)
+    faces = np.asarray(faces).reshape(-1, 3)
+    if len(faces) == 0 or (cell_size <= 0 and len(faces) <= max_triangles):
+        return np.arange(len(faces)), faces
+    keep = np.zeros(len(verts), dtype=bool)
+    keep[keep_vertices] = True
+    keep[boundary_vertices(faces)] = True
+    used = np.unique(faces)
+    bounds = (verts[used, 0].min(), verts[used, 1].min())
+    extent = max(verts[used, 0].max() - bounds[0], verts[used, 1].max() - bounds[1], 1e-9)
+    if cell_size > 0:
+        return _cluster(verts, faces, used, keep, bounds, cell_size)
+
+    # start with cells of a regular grid with max_triangles and adapt to the triangles the clustering gives
+    cells = np.sqrt(max_triangles / 2)
+    best = None
+    for _ in range(SIMPLIFY_ITERATIONS):
+        trias, new_faces = _cluster(verts, faces, used, keep, bounds, extent / max(cells, 1))
+        if len(trias) <= max_triangles and (best is None or len(trias) > len(best[0])):
+            best = (trias, new_faces)
+        if abs(len(trias) - max_triangles) < max_triangles * 0.05 or cells <= 1:
+            break
+        cells = cells * np.sqrt(max_triangles / max(len(trias), 1)) * (0.97 if len(trias) > max_triangles else 1.0)
+    if best is None:  # kept vertices do not allow less triangles
+        best = (trias, new_faces)
+    return best
+
+
+def merged_uvs(faces, trias, new_faces, mats, uvs):
+    """
+    Returns uvs per corner (n, 3, 2) for the triangles trias of a mesh simplified with simplify_mesh to new_faces.
+    Corners of merged vertices take the uv the vertex they were merged into has in a triangle of the same material
+    (mats per triangle), so that textures do not shift. Without such a triangle the corner keeps its uv.
+    """
+    faces = np.asarray(faces).reshape(-1, 3)
+    new_uvs = np.array(uvs[trias])
+    merged = np.nonzero(new_faces != faces[trias])
+    if len(merged[0]) == 0:
+        return new_uvs
+    n_mats = int(mats.max()) + 1
+    keys = faces.ravel().astype(np.int64) * n_mats + np.repeat(mats, 3)
+    corner_keys, first = np.unique(keys, return_index=True)
+    wanted = new_faces[merged].astype(np.int64) * n_mats + mats[trias][merged[0]]
+    found = np.minimum(np.searchsorted(corner_keys, wanted), len(corner_keys) - 1)
+    ok = corner_keys[found] == wanted
+    new_uvs[merged[0][ok], merged[1][ok]] = uvs.reshape(-1, 2)[first[found[ok]]]
+    return new_uvs
+
+
+def _cluster(verts, faces, used, keep, bounds, cell_size):
+    column = np.floor((verts[:, 0] - bounds[0]) / cell_size).astype(np.int64)
+    row = np.floor((verts[:, 1] - bounds[1]) / cell_size).astype(np.int64)
+    cluster = column * (row.max() + 1) + row
+    cluster[keep] = cluster.max() + 1 + np.flatnonzero(keep)  # own cluster for each vertex that is kept
+    _, first, inverse = np.unique(cluster[used], return_index=True, return_inverse=True)
+    merged = np.arange(len(verts))
+    merged[used] = used[first][inverse.reshape(-1)]
+    new_faces = merged[faces]
+    trias = np.flatnonzero((new_faces[:, 0] != new_faces[:, 1]) & (new_faces[:, 1] != new_faces[:, 2]) & (new_faces[:, 2] != new_faces[:, 0]))
+    # triangles merged into the same vertices are kept once
+    corners = np.sort(new_faces[trias], axis=1)
+    _, first = np.unique(corners, axis=0, return_index=True)
+    trias = trias[np.sort(first)]
+    return trias, new_faces[trias]
+
+
+def _concat(arrays, empty_shape, dtype):
+    if len(arrays) == 0:
+        return np.zeros(empty_shape, dtype=dtype)
+    return np.concatenate(arrays)
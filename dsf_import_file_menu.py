@@ -15,14 +15,24 @@
 # ******************************************************************************
 
 from xplnedsf2 import *
+import concurrent.futures
+import hashlib
+import os
+import tempfile
+import dsf_extract
+import dsf_cache
+import dsf_profile
+import dsf_terrain
+import numpy as np
 import bpy
-from bpy.props import BoolProperty, EnumProperty, StringProperty, IntProperty, FloatProperty
-from bpy.types import Operator
+from bpy.props import BoolProperty, EnumProperty, StringProperty, IntProperty, FloatProperty, CollectionProperty
+from bpy.types import Operator, OperatorFileListElement
 from bpy_extras.io_utils import ExportHelper, ImportHelper
 
 #### IMPORTANT: Requires xplnedsf2.py from https://github.com/nofaceinbook/muxp in your Blender python/lib directory 
 ####            For the moment the dsf file must be unzipped or you install PLYZMA in Blender Python 
-####            Rendering a complete O4XP tile probably causes out of memory fault 
+####            Also copy dsf_extract.py, dsf_cache.py, dsf_profile.py and dsf_terrain.py of this repository to the same directory
+####            Rendering a complete O4XP tile probably causes out of memory fault, use then memory budget for streaming
 
 
 
@@ -35,9 +45,53 @@ dsf_file = 'X:/X-Plane/steamapps/common/X-Plane 11/Custom Scenery/zzzz_MUXP_defa
 #dsf_file = 'X:/X-Plane/steamapps/common/X-Plane 11/Custom Scenery/zOrtho4XP_+32-017/Earth nav data/+30-020/+32-017.dsf'
 
 
+ORIGINAL_PROPERTY = "dsf2blender_original"  # custom property of images using a proxy with filename of the original texture
+PROXY_PROPERTY = "dsf2blender_proxy"  # custom property of images using a proxy with filename of the proxy
+SOURCE_PROPERTY = "dsf2blender_source"  # custom property of objects with batch and name of the object in its tile
+HASH_PROPERTY = "dsf2blender_hash"  # custom property of objects with hash of their mesh data and materials
+TILE_PROPERTY = "dsf2blender_tile"  # custom property of collections with their name as created and the tile
+
+_texture_proxies = dict()  # proxy filename (depends on texture file, its size and time) and the file used instead of the texture
+
+
+class MaterialRegistry:
+    """
+    Blender materials created by imports, found by key of terrain, near, far, projection, overlay and texture files.
+    The key is stored as custom property of the material, so materials of earlier imports, other tiles
+    and loaded .blend files are reused instead of creating duplicates.
+    """
+    KEY_PROPERTY = "dsf2blender_key"
+
+    def __init__(self):
+        self.materials = dict()  # key of material as key and Blender material as value
+        self.hits = 0
+        self.misses = 0
+        for m in bpy.data.materials:
+            key = m.get(self.KEY_PROPERTY)
+            if isinstance(key, str):
+                self.materials[key] = m
+
+    def get(self, key):
+        """
+        Returns material for key or None if there is no such material yet.
+        """
+        if key in self.materials:
+            self.hits += 1
+            return self.materials[key]
+        self.misses += 1
+        return None
+
+    def add(self, key, m):
+        m[self.KEY_PROPERTY] = key
+        self.materials[key] = m
+
+
 class DSF_loader:
-    def __init__(self, wb, eb, sb, nb, scl, lp_overlay):
+    def __init__(self, wb, eb, sb, nb, scl, lp_overlay, engine="PYTHON", budget=0, cells=1, cache_dir="", workers=0, report_file="", textures="LOAD", proxy_size=0,
+                 lod_distance=-1, lod_objects=False, simplify_triangles=0, simplify_cell=0.0,
+                 heightfield=0, incremental=False):
 
+        self.AREA = (wb, eb, sb, nb)  # area as given, which is made absolute for each tile in set_tile
         self.AREA_W = wb  # define area from west to east and south to north to be extracted 
         self.AREA_E = eb  # 0 to 1 extracts the full one by on grid
         self.AREA_S = sb  # you could also use the full coordinates like 50.21 or -7.4
@@ -47,79 +101,84 @@ class DSF_loader:
 
         self.LAYER_PER_OVERLAY = lp_overlay  # if this is true each overlay terrain will be defined as individual object
 
+        self.ENGINE = engine  # "PYTHON" extracts triangle by triangle, "NUMPY" extracts all triangles of a patch at once
+
+        self.MEMORY_BUDGET = budget  # MB for arrays of the tile and extracted data before meshes are created; 0 extracts full area at once
+
+        self.GRID_CELLS = cells  # number of objects per layer from west to east and south to north; 1 for one object per layer
+
+        self.CACHE_DIR = cache_dir  # directory to store extracted meshes for faster re-import; empty for no cache
+
+        self.WORKERS = workers  # processes extracting tiles when importing several dsf files; 0 for number of cores
+
+        self.REPORT_FILE = report_file  # json file to write time, memory and counts of the import stages to; empty for none
+
+        self.TEXTURES = textures  # "LOAD" reads textures during import, "LAZY" when Blender needs them, "BACKGROUND" after import
+
+        self.PROXY_SIZE = proxy_size  # maximum width and height of textures, larger ones are replaced by reduced proxies; 0 for originals
+
+        self.LOD_DISTANCE = lod_distance  # import only patches shown at this view distance in meters; below 0 for all patches
+
+        self.LOD_OBJECTS = lod_objects  # if this is true layers are split into objects per view distance range (near, far)
+
+        self.SIMPLIFY_TRIANGLES = simplify_triangles  # basemesh is simplified to about this number of triangles per batch; 0 for full basemesh
+
+        self.SIMPLIFY_CELL = simplify_cell  # basemesh vertices closer than this (in Blender units) are merged; 0 to use SIMPLIFY_TRIANGLES
+
+        self.HEIGHTFIELD = heightfield  # grid squares per side of a heightfield from the elevation raster instead of the patches; 0 for the mesh
+
+        self.INCREMENTAL = incremental  # if this is true objects of an earlier import of the tile are kept when their data is unchanged
+
+        self.profiler = dsf_profile.Profiler()  # records the stages of the import
+
+        # parsed terrain files shared by all imports, stored also in the cache directory if there is one
+        self.terrain_cache = dsf_terrain.terrain_cache(os.path.join(cache_dir, dsf_terrain.INDEX_FILE) if cache_dir else "")
+
+        self.origin = None  # west and south of the first imported tile, which is at origin in Blender
+
+        self.material_registry = None  # materials to be reused, found with the first tile created
+
+        self.previous_objects = dict()  # with INCREMENTAL objects of the earlier import of the tile per source (see SOURCE_PROPERTY)
+
+        self.batch = 0  # batch of the objects created
+
+        self.overlay_keys = None  # when simplifying streamed batches the vertex keys of all overlays in the tile
+
+        self.lazy_images = dict()  # filename as key and image not yet loaded as value
+
     def read_ter_file(self, terpath, xppath, dsf_path):
         """
         Reads X-Plane terrain file (.ter) in terpath and returns values as dictionary.
         In case of errors the dict contains key ERROR with value containing description of error.
         To read default terrains the path for X-Plane (xppath) is needed.
         dsfpath is the path of the dsf file that contains the terrain definition. Needed to read dsf specific terrain.
+        Terrain files already read are taken from the terrain cache (see dsf_terrain.py).
         """
-        ter = dict()
-        
-        dsfpath = dsf_path.replace("\\", "/") ############ NEW ######## TBD: USE FILE DELIMITER INDEPENDENT COMMANDS ###########
-        
-        if terpath == 'terrain_Water':  # No terrian file for Water
-            return ter
-        
-        if terpath.endswith('_OVL'):  #### TBD: Can probably be removed as function is called with terrain name now
-            overlay = True
-            terpath = terpath[:-4]  # remove _OVL now from terrain name
-
-        ### TBD: handle different path delimeters in given pathes like \ by replacing them ? ####
-        if terpath.startswith("lib/g10"):  # global XP 10 terrain definition
-            #### TBD: Build path correct for every file system ###
-            filename = xppath + "/Resources/default scenery/1000 world terrain" + terpath[7:]  # remove lib/g10
-        elif terpath.startswith("terrain/"):  # local dsf terrain definition
-            filename = dsfpath[:dsfpath.rfind("Earth nav data")] + terpath  # remove part for dsf location
-            ### TBD: Error check that terrain file exists
-        else:
-            ter["ERROR"] = "Unknown Terrain definition: " + terpath
-            return ter
-            ##### TBD: Build filename for local .ter files starting with ../ using dsfpath #######
-
-        try:
-            with open(filename, encoding="utf8") as f:
-                for line in f:  ### TBD: Check that first three lines contain A  800  TERRAIN   #####
-                    values = line.split()
-                    #print(values)
-                    if len(values) > 0:  # skip empty line
-                        key = values.pop(0)
-                        if len(values) > 0 and values[0].startswith("../"):  # replace relative path with full path
-                            filepath = filename[:filename.rfind("/")]  # get just path without name of file in path
-                            values[0] = filepath[:filepath.rfind("/") + 1] + values[0][3:]
-                            #print("###", filename, values[0])
-                            ### TBD: Handle ERROR when '/' is not found; when other delimiters are used
-                        ter[key] = values
-                    ### TBD: in case of multiple keys in files append new values to existing key
-        except IOError:
-            ter["ERROR"] = "Error reading terrain file: " + filename
-
-        return ter
-
+        return dsf_terrain.read_ter_file(terpath, xppath, dsf_path, self.terrain_cache)
 
     def add_material(self, matName, ter, bpy):
         m = bpy.data.materials.new(matName)
         if matName.find('terrain_Water') < 0:  # this is no water 
             if "BASE_TEX" in ter:
-                teximagefile =  ter["BASE_TEX"][0].replace("/", "\\\\")  
+                teximagefile =  os.path.normpath(ter["BASE_TEX"][0])  # path delimiter of the system
             elif "BASE_TEX_NOWRAP" in ter:
-                teximagefile =  ter["BASE_TEX_NOWRAP"][0].replace("/", "\\\\") 
+                teximagefile =  os.path.normpath(ter["BASE_TEX_NOWRAP"][0])
             #print("Loading texture image: {}".format(teximagefile))
             m.use_nodes = True
             bsdf = m.node_tree.nodes["Principled BSDF"]
             texImage = m.node_tree.nodes.new('ShaderNodeTexImage')
             texImage.location = (-400,280)
-            texImage.image = bpy.data.images.load(teximagefile, check_existing=True)
+            texImage.image = self.load_image(teximagefile)
             m.node_tree.links.new(bsdf.inputs['Base Color'], texImage.outputs['Color'])
             bsdf.inputs[7].default_value = 0.01  # This is setting the specular intensity
             ### TBD: increase rougness
             if matName.endswith( "_O"):  # add border texture for overlay
                 if "BORDER_TEX" in ter:
-                    borderimagefile = ter["BORDER_TEX"][0].replace("/", "\\\\")
+                    borderimagefile = os.path.normpath(ter["BORDER_TEX"][0])
                     borderImage = m.node_tree.nodes.new('ShaderNodeTexImage')
                     borderImage.location = (-400,0)
                     ############### TBD: Check that existing images are used - if it works as below use everywhere where image is loaded
-                    borderImage.image = bpy.data.images.load(borderimagefile, check_existing=True)
+                    borderImage.image = self.load_image(borderimagefile)
                     borderImage.image.colorspace_settings.name = 'Non-Color'
                     m.node_tree.links.new(bsdf.inputs['Alpha'], borderImage.outputs['Color'])                 
                     m.blend_method = 'CLIP'
@@ -131,61 +190,91 @@ class DSF_loader:
                     print("WARNING: No texture file found for this terrain overlay/material!\n")
                 
         else:  ### TBD: don't double everything below
-            teximagefile = self.xp_path + "/Resources/bitmaps/world/water/any.png"
-            teximagefile.replace("/", "\\\\")
+            teximagefile = os.path.normpath(self.xp_path + "/Resources/bitmaps/world/water/any.png")
             #print("Loading texture image: {}".format(teximagefile))
             m.use_nodes = True
             bsdf = m.node_tree.nodes["Principled BSDF"]
             texImage = m.node_tree.nodes.new('ShaderNodeTexImage')
-            texImage.image = bpy.data.images.load(teximagefile, check_existing=True)
+            texImage.image = self.load_image(teximagefile)
             m.node_tree.links.new(bsdf.inputs['Base Color'], texImage.outputs['Color'])
             ### TBD: Change specular, roughness, transmission to good values for water
         return m
                 
-    def execute(self, dsf_file):
-        print("------------ Starting to use DSF ------------------")
-        print("Reading DSF file: {}".format(dsf_file))
-        self.xp_path = 'X:/X-Plane/steamapps/common/X-Plane 11'  ########### TBD: be retrieved from dsf file  ##########
-        
-        dsf = XPLNEDSF()
-        dsf.read(dsf_file)
+    def load_image(self, filename):
+        """
+        Returns image of filename, using an already loaded one.
+        With TEXTURES other than "LOAD" the image gets just the filename and its pixels are read when Blender needs
+        them, e.g. when shown in the viewport, so that the file is not read during import.
+        With PROXY_SIZE the image uses the proxy of the file (see texture_proxy) and stores the original filename
+        in custom property ORIGINAL_PROPERTY to switch back (see switch_textures).
+        """
+        original = filename
+        if self.PROXY_SIZE:
+            with self.profiler.stage("create materials/texture proxies", 1):
+                filename = self.texture_proxy(filename)
+        if self.TEXTURES == "LOAD":
+            image = bpy.data.images.load(filename, check_existing=True)
+        elif filename in self.lazy_images:
+            image = self.lazy_images[filename]
+        else:
+            image = find_image(filename)  # image of an earlier import or loaded .blend file
+            if image is None:
+                image = bpy.data.images.new(os.path.basename(filename), 1, 1)
+                image.source = 'FILE'  # switching the source instead of loading leaves the pixels unread
+                image.filepath = filename
+            self.lazy_images[filename] = image
+        if filename != original:
+            image[ORIGINAL_PROPERTY] = original
+            image[PROXY_PROPERTY] = filename
+        return image
 
-        grid_west = int(dsf.Properties["sim/west"])
-        grid_south = int(dsf.Properties["sim/south"])
-        print("Importing Mesh and setting west={} and south={} to origin.".format(grid_west, grid_south))
-        if 0 <= self.AREA_W <= 1 and 0 <= self.AREA_S <= 1: 
-            self.AREA_W += grid_west
-            self.AREA_E += grid_west
-            self.AREA_S += grid_south
-            self.AREA_N += grid_south
-        print("But extracting just from west {} to east {} and south {} to north {}".format(self.AREA_W, self.AREA_E, self.AREA_S, self.AREA_N))
+    def texture_proxy(self, filename):
+        """
+        Returns filename of a copy of the texture reduced to at most PROXY_SIZE pixels width and height.
+        The proxy is created with the first use and stored in the cache directory or if there is none in the
+        temporary directory. If the texture can not be read or already fits into PROXY_SIZE, filename itself is returned.
+        The result is remembered in _texture_proxies, so that each texture is only read once per Blender session.
+        """
+        try:
+            proxy = dsf_cache.proxy_filename(self.CACHE_DIR or os.path.join(tempfile.gettempdir(), "dsf2blender"), filename, self.PROXY_SIZE)
+        except OSError:
+            return filename
+        if proxy in _texture_proxies:
+            return _texture_proxies[proxy]
+        if os.path.exists(proxy):
+            _texture_proxies[proxy] = proxy
+            return proxy
+        existing = find_image(filename)
+        try:
+            image = existing or bpy.data.images.load(filename)
+        except RuntimeError:
+            _texture_proxies[proxy] = filename
+            return filename
+        width, height = image.size
+        if max(width, height) <= self.PROXY_SIZE:  # small textures are used as they are
+            if existing is None and self.TEXTURES != "LOAD":  # with "LOAD" load_image uses the image already read
+                bpy.data.images.remove(image)
+            _texture_proxies[proxy] = filename
+            return filename
+        if existing is not None:  # the image of the original texture is not changed
+            image = bpy.data.images.load(filename)
+            width, height = image.size
+        scale = self.PROXY_SIZE / max(width, height)
+        image.scale(max(1, round(width * scale)), max(1, round(height * scale)))
+        os.makedirs(os.path.dirname(proxy), exist_ok=True)
+        image.filepath_raw = proxy
+        image.file_format = 'PNG'
+        image.save()
+        bpy.data.images.remove(image)
+        _texture_proxies[proxy] = proxy
+        return proxy
 
-        #### Load all terrain files that dsf file into a dictionary ###
-        terrain_details = dict()  # containing per terrain index the details of .ter-file in dict
-        for id in dsf.DefTerrains:
-            print("Loading Terrain {}".format(dsf.DefTerrains[id]))
-            terrain_details[id] = self.read_ter_file(dsf.DefTerrains[id], self.xp_path, dsf_file)
-            if "ERROR" in terrain_details[id]:
-                print(terrain_details[id]["ERROR"])
-        print("Loaded {} terrain details".format(len(terrain_details)))
-
-        # SORT mesh patches so that pyhiscal mesh is bottom layer and all overlys are above
-        # All layers sorted based on the flag and id of terrain in list, so that they will get higher z-value to avoid same z-layer artefacts
-        # Also sort by near and far values to store them later in material name
-        # In addition this sorting allows to switch materials with every layer
-        ######## TBD: Give option to avoid loading of overlays
-        ter_layers = dict()
-        for p in dsf.Patches:
-            #print("TerIndex {}:  Flag: {}  Near: {}   Far: {}".format(p.defIndex, p.flag, p.near, p.far))
-            ter_type = (p.flag, p.defIndex, p.near, p.far)
-            if ter_type in ter_layers:
-                ter_layers[ter_type].append(p)
-            else:
-                ter_layers[ter_type] = [p]
-        print("Sorted {} mesh patches into {} different types".format(len(dsf.Patches), len(ter_layers)))        
-            
+    def extract_mesh(self, dsf, ter_layers, terrain_details, grid_west, grid_south):
+        """
+        Extracts all triangles of the patches in ter_layers that are inside the area and arranges them in layers.
+        Returns verts, normals, faces, uvs, uvs2, materials, matIndexPerTria, used_materials.
+        """
         verts = []
-        edges = []  # will not be filled as Blender takes in case of empty edges the edges from the faces
         normals = []  # normals stored per vertex
         faces = [[]]
         uvs = [[]]
@@ -195,6 +284,8 @@ class DSF_loader:
         materials = []  # list containing all information for all materials for all layers used
         matIndexPerTria = [[]] # list of material index for each tria of mesh
         used_materials = [[]]  # list containing for each layer the used materials
+        area = (self.AREA_W, self.AREA_E, self.AREA_S, self.AREA_N)
+        patch_index = dsf_extract.dsf_arrays(dsf)[1]  # bounding boxes of patches to skip them or their tria tests
 
         for ter_layer_id in sorted(ter_layers.keys()):      
             projected_uv = ("PROJECTED" in terrain_details[ter_layer_id[1]]) # 2nd valud in ter_layer_id includes defintionIndex of patch
@@ -205,6 +296,9 @@ class DSF_loader:
                 else: 
                     layer += 1  # this requires that there was base-mesh before settin layer=0
             for p in ter_layers[ter_layer_id]:
+                area_test = patch_index.area_test(p, area)
+                if area_test < 0:  # no vertex of patch inside area
+                    continue
                 trias = p.triangles()
                 
                 if water and len(trias) and len(dsf.V[trias[0][0][0]][trias[0][0][1]]) <= 5:
@@ -216,7 +310,7 @@ class DSF_loader:
                 # if water is projected depends if uv coordinates are given or not, taken from ferst vertex in first tria
 
                 for t in trias:
-                    if not (self.AREA_W <= dsf.V[t[0][0]][t[0][1]][0] <= self.AREA_E and self.AREA_S <= dsf.V[t[0][0]][t[0][1]][1] <= self.AREA_N)  \
+                    if area_test == 0 and not (self.AREA_W <= dsf.V[t[0][0]][t[0][1]][0] <= self.AREA_E and self.AREA_S <= dsf.V[t[0][0]][t[0][1]][1] <= self.AREA_N)  \
                         and not (self.AREA_W <= dsf.V[t[1][0]][t[1][1]][0] <= self.AREA_E and self.AREA_S <= dsf.V[t[1][0]][t[1][1]][1] <= self.AREA_N) \
                         and not (self.AREA_W <= dsf.V[t[2][0]][t[2][1]][0] <= self.AREA_E and self.AREA_S <= dsf.V[t[2][0]][t[2][1]][1] <= self.AREA_N):
                             continue
@@ -286,102 +380,456 @@ class DSF_loader:
                     mat_id = len(materials) - 1     
                     if len(used_materials[layer]) == 0 or mat_id != used_materials[layer][-1]:  # as materials are sorted per layer_id we need just to check if required material is at end of the list
                         used_materials[layer].append(mat_id)
-                    matIndexPerTria[layer].append(len(used_materials[layer]) - 1)  
-
-        print("Arranged mesh into {} layers with {} materials".format(len(faces), len(materials)))
-                        
-        ### Create materials ###
-        created_materials = []  # list containg references to all created blender materials
-        for ter_layer_id in materials:
-            terrain_name = str(ter_layer_id[1]) + '_'  # include terrain defintion index to allow correct sorting for a later import
-            terrain_name += dsf.DefTerrains[ter_layer_id[1]]  # add name of terrain
-            terrain_name = terrain_name + "_" + str(ter_layer_id[2]) + "_" + str(ter_layer_id[3])  # add near and far values for a later import
-            ######### IDEA: STORE VALUES in material properties or special nodes ###########################
-            if "PROJECTED" in terrain_details[ter_layer_id[1]]:
-                terrain_name += "_P"  # add if base mesh is projected 
-            if ter_layer_id[0] > 1:  # this is an overlay
-                terrain_name += "_O"
-            m = self.add_material(terrain_name, terrain_details[ter_layer_id[1]], bpy)  # add material to Blender materials
-            created_materials.append(m)
-                
-        print("Created {} materials".format(len(created_materials)))        
+                    matIndexPerTria[layer].append(len(used_materials[layer]) - 1)
 
-        # Create own collection for basemesh and overlays
-        main_collection = bpy.data.collections.new("XPDSF")
-        bpy.context.scene.collection.children.link(main_collection)
-        ol_collection = bpy.data.collections.new("Overlays")
-        main_collection.children.link(ol_collection)
+        return verts, normals, faces, uvs, uvs2, materials, matIndexPerTria, used_materials
+
+    def get_material(self, ter_layer_id, terrains, terrain_details):
+        """
+        Returns the Blender material for the terrain layer id, creating it with the first use.
+        """
+        if ter_layer_id in self.created_materials:
+            return self.created_materials[ter_layer_id]
+        ter = terrain_details[ter_layer_id[1]]
+        textures = [ter[t][0] for t in ("BASE_TEX", "BASE_TEX_NOWRAP", "BORDER_TEX") if t in ter]
+        key = "|".join([terrains[ter_layer_id[1]], str(ter_layer_id[2]), str(ter_layer_id[3]), str("PROJECTED" in ter),
+                        str(ter_layer_id[0] > 1)] + textures + ([str(self.PROXY_SIZE)] if self.PROXY_SIZE else []))
+        m = self.material_registry.get(key)  # reuse material of other tile or earlier import
+        if m is not None:
+            self.created_materials[ter_layer_id] = m
+            return m
 
+        terrain_name = str(ter_layer_id[1]) + '_'  # include terrain defintion index to allow correct sorting for a later import
+        terrain_name += terrains[ter_layer_id[1]]  # add name of terrain
+        terrain_name = terrain_name + "_" + str(ter_layer_id[2]) + "_" + str(ter_layer_id[3])  # add near and far values for a later import
+        ######### IDEA: STORE VALUES in material properties or special nodes ###########################
+        if "PROJECTED" in terrain_details[ter_layer_id[1]]:
+            terrain_name += "_P"  # add if base mesh is projected 
+        if ter_layer_id[0] > 1:  # this is an overlay
+            terrain_name += "_O"
+        with self.profiler.stage("create materials", 1):
+            m = self.add_material(terrain_name, terrain_details[ter_layer_id[1]], bpy)  # add material to Blender materials
+        self.material_registry.add(key, m)
+        self.created_materials[ter_layer_id] = m
+        return m
 
+    def add_layer_objects(self, terrains, terrain_details, verts, normals, faces, uvs, uvs2, materials, matIndexPerTria, used_materials):
+        """
+        Creates for each layer with triangles an object in the XPDSF (basemesh) or Overlays collection.
+        With LOD_OBJECTS each layer is split into objects per view distance range (near, far) of its terrains.
+        With SIMPLIFY_TRIANGLES or SIMPLIFY_CELL the basemesh is simplified before, keeping its border and overlay vertices.
+        Values are the ones returned by the extraction.
+        """
+        verts = np.asarray(verts).reshape(-1, 3)
+        normals = np.asarray(normals).reshape(-1, 3)
         for layer in range(len(faces)):
+            if len(faces[layer]) == 0:
+                continue
             if layer == 0:
                 mesh_name = "Basemesh"
+                col = self.main_collection
             else:
                 mesh_name = "Overlay_" + str(layer)
-                ### TBD Group overlays in own group
-            mesh = bpy.data.meshes.new(mesh_name)  # add the new mesh
+                col = self.ol_collection
+            layer_materials = [self.get_material(materials[m], terrains, terrain_details) for m in used_materials[layer]]
+            layer_faces = np.asarray(faces[layer]).reshape(-1, 3)
+            layer_mats = np.asarray(matIndexPerTria[layer])
+            layer_uvs = np.asarray(uvs[layer]).reshape(-1, 3, 2)  # uvs per tria to select them with the trias
+            if layer > 0:  # we have overlay, so also add border uvs
+                layer_uvs2 = np.asarray(uvs2[layer]).reshape(-1, 3, 2)
+            else:
+                layer_uvs2 = None
+            if layer == 0 and (self.SIMPLIFY_TRIANGLES > 0 or self.SIMPLIFY_CELL > 0):
+                layer_faces, layer_mats, layer_uvs = self.simplify_basemesh(verts, faces, layer_faces, layer_mats, layer_uvs)
 
+            if not self.LOD_OBJECTS:
+                self.add_layer_object(col, mesh_name, layer, layer_materials, verts, normals, layer_faces, layer_mats, layer_uvs, layer_uvs2)
+                continue
+            ranges = [tuple(materials[m][2:4]) for m in used_materials[layer]]  # near and far of the layer materials
+            for near, far in sorted(set(ranges)):
+                lod_mats = [i for i, r in enumerate(ranges) if r == (near, far)]
+                trias = np.flatnonzero(np.isin(layer_mats, lod_mats))
+                self.add_layer_object(col, "{}_LOD_{:g}_{:g}".format(mesh_name, near, far), layer, [layer_materials[i] for i in lod_mats],
+                                      verts, normals, layer_faces[trias], np.searchsorted(lod_mats, layer_mats[trias]),
+                                      layer_uvs[trias], None if layer_uvs2 is None else layer_uvs2[trias])
+
+    def simplify_basemesh(self, verts, faces, base_faces, base_mats, base_uvs):
+        """
+        Returns faces, material indices and uvs of the simplified basemesh (base_faces etc.), where vertices
+        also used by the overlays in faces are kept, so that overlays still fit on the basemesh.
+        When streaming the overlays are in other batches, so also vertices with overlay_keys of the tile are kept.
+        Corners of merged vertices get the uvs of the vertex they were merged into (see dsf_extract.merged_uvs).
+        """
+        with self.profiler.stage("simplify basemesh", len(base_faces)):
+            overlay_verts = [np.asarray(f).ravel() for f in faces[1:]]
+            if self.overlay_keys is not None:
+                overlay_verts.append(np.flatnonzero(np.isin(dsf_extract.verts_keys(verts), self.overlay_keys)))
+            overlay_verts = np.concatenate(overlay_verts) if overlay_verts else np.zeros(0, dtype=np.int64)
+            trias, new_faces = dsf_extract.simplify_mesh(verts, base_faces, overlay_verts, self.SIMPLIFY_TRIANGLES, self.SIMPLIFY_CELL)
+        print("Simplified basemesh from {} to {} triangles".format(len(base_faces), len(trias)))
+        if self.SIMPLIFY_CELL <= 0 and len(trias) > self.SIMPLIFY_TRIANGLES:
+            print("WARNING: Basemesh has more than {} triangles, as vertices of the tile border and overlays are kept".format(
+                self.SIMPLIFY_TRIANGLES))
+        return new_faces, base_mats[trias], dsf_extract.merged_uvs(base_faces, trias, new_faces, base_mats, base_uvs)
+
+    def add_layer_object(self, col, mesh_name, layer, layer_materials, verts, normals, faces, mat_index, uvs, uvs2):
+        """
+        Creates object with the triangles of a layer, which only contains the vertices used by the triangles.
+        With GRID_CELLS > 1 the triangles are split into GRID_CELLS x GRID_CELLS objects of the area.
+        """
+        if self.GRID_CELLS > 1:
+            bounds = ((self.AREA_W - self.grid_west) * self.SCALING, (self.AREA_E - self.grid_west) * self.SCALING,
+                      (self.AREA_S - self.grid_south) * self.SCALING, (self.AREA_N - self.grid_south) * self.SCALING)
+            for column, row, trias in dsf_extract.cell_buckets(verts, faces, self.GRID_CELLS, bounds):
+                verts_cell, normals_cell, faces_cell = dsf_extract.compact_vertices(verts, normals, faces[trias])
+                self.add_object(col, "{}_{}_{}".format(mesh_name, column, row), layer, layer_materials,
+                                verts_cell, normals_cell, faces_cell, mat_index[trias],
+                                uvs[trias], None if uvs2 is None else uvs2[trias])
+            return
+
+        # only vertices used by the layer, which also applies to the basemesh when most of the tile is outside the area
+        verts_layer, normals_layer, faces_layer = dsf_extract.compact_vertices(verts, normals, faces)
+        self.add_object(col, mesh_name, layer, layer_materials, verts_layer, normals_layer, faces_layer, mat_index, uvs, uvs2)
+
+    def add_object(self, col, mesh_name, layer, layer_materials, verts, normals, faces, mat_index, uvs, uvs2):
+        """
+        Creates object with new mesh mesh_name in collection col with materials and mesh data given.
+        With INCREMENTAL the object of the earlier import is kept if materials and mesh data are unchanged,
+        otherwise it is replaced.
+        """
+        source = "{}/{}".format(self.batch, mesh_name)
+        obj = self.previous_objects.pop(source, None)
+        key = None
+        if self.INCREMENTAL or obj is not None:  # hash is only needed to compare with a later or earlier import
+            with self.profiler.stage("hash objects", len(faces)):
+                key = object_hash(layer_materials, verts, normals, faces, mat_index, uvs, uvs2)
+        if obj is not None:
+            if obj.get(HASH_PROPERTY) == key:
+                self.kept_objects += 1
+                self.place_object(obj, layer)
+                return
+            remove_object(obj)
+
+        with self.profiler.stage("build meshes", len(faces)):
+            mesh = bpy.data.meshes.new(mesh_name)  # add the new mesh
             obj = bpy.data.objects.new(mesh.name, mesh)
-            
-            if mesh_name.startswith("Base"):
-                col = bpy.data.collections.get("XPDSF")
-            else:
-                col = bpy.data.collections.get("Overlays")
-                
             col.objects.link(obj)
             bpy.context.view_layer.objects.active = obj
 
-            ##### Delete loose vertices #### 
-            if layer > 0:
-                verts_layer = []
-                faces_layer = []
-                normals_layer = []
-                verts_index = dict()
-                for t in faces[layer]:
-                    faces_layer.append([])
-                    for v in t:
-                        if v in verts_index:
-                            faces_layer[-1].append(verts_index[v])
-                        else:
-                            verts_layer.append(verts[v])
-                            normals_layer.append(normals[v])
-                            verts_index[v] = len(verts_layer) - 1
-                            faces_layer[-1].append(len(verts_layer) - 1)
-            else:
-                verts_layer = verts
-                faces_layer = faces[layer]
-                normals_layer = normals    #faces[layer] = []  # free memory (if this helps) ...
+            # ADDING MATERIALS PER LAYER
+            for m in layer_materials:
+                mesh.materials.append(m)
+
+            self.fill_mesh(mesh, verts, faces, normals, mat_index, uvs, uvs2)
+        obj[SOURCE_PROPERTY] = source
+        if key is not None:
+            obj[HASH_PROPERTY] = key
+        self.built_objects += 1
+        self.place_object(obj, layer)
+
+    def place_object(self, obj, layer):
+        ### Move tiles next to the first one and overlays along z-axis
+        obj.location.x = (self.grid_west - self.origin[0]) * self.SCALING
+        obj.location.y = (self.grid_south - self.origin[1]) * self.SCALING
+        obj.location.z = layer * 0.01
+
+    def fill_mesh(self, mesh, verts, faces, normals, mat_index, uvs, uvs2=None):
+        """
+        Fills the empty Blender mesh with vertices, triangles, material index per triangle, uvs per loop (baseUV)
+        and custom normals per vertex. If uvs2 are given they are added as borderUV.
+        All values are passed as flat arrays to Blender with foreach_set instead of setting them per polygon and loop.
+        """
+        verts = np.asarray(verts, dtype=np.float32).reshape(-1, 3)
+        faces = np.asarray(faces, dtype=np.int32).reshape(-1, 3)
+        n_loops = faces.size
+
+        mesh.vertices.add(len(verts))
+        mesh.vertices.foreach_set("co", verts.ravel())
+        mesh.loops.add(n_loops)
+        mesh.loops.foreach_set("vertex_index", faces.ravel())
+        mesh.polygons.add(len(faces))
+        mesh.polygons.foreach_set("loop_start", np.arange(0, n_loops, 3, dtype=np.int32))
+        mesh.polygons.foreach_set("loop_total", np.full(len(faces), 3, dtype=np.int32))
+        mesh.polygons.foreach_set("material_index", np.asarray(mat_index, dtype=np.int32).ravel())
+        mesh.update(calc_edges=True)  # Blender takes the edges from the faces
+
+        with self.profiler.stage("build meshes/uvs and normals", n_loops):
+            new_uv = mesh.uv_layers.new(name='baseUV')
+            new_uv.data.foreach_set("uv", np.asarray(uvs, dtype=np.float32).ravel())
+            new_uv.active_render = True
+            if uvs2 is not None:
+                border_uv = mesh.uv_layers.new(name='borderUV')
+                border_uv.data.foreach_set("uv", np.asarray(uvs2, dtype=np.float32).ravel())
 
-            mesh.from_pydata(verts_layer, edges, faces_layer)
             mesh.use_auto_smooth = True  # needed to make use of imported normals split
-            #mesh.normals_split_custom_set([(0, 0, 0) for l in mesh.loops])
-            mesh.normals_split_custom_set_from_vertices(normals_layer)  # set imported normals as custom split vertex normals    
+            mesh.normals_split_custom_set_from_vertices(np.asarray(normals, dtype=np.float32).reshape(-1, 3))  # set imported normals as custom split vertex normals
 
-            # ADDING MATERIALS PER LAYER
-            for m in used_materials[layer]:
-                bpy.context.object.data.materials.append(created_materials[m])
+    def extract_batches(self, dsf, ter_layers, terrain_details, grid_west, grid_south):
+        """
+        Generator returning the extracted meshes as one batch or, when streaming with memory budget, as several batches.
+        """
+        area = (self.AREA_W, self.AREA_E, self.AREA_S, self.AREA_N)
+        if self.MEMORY_BUDGET:  # stream the dsf in batches and create meshes for each batch before extracting the next
+            max_triangles = dsf_extract.budget_triangles(dsf, self.MEMORY_BUDGET, self.profiler)
+            if self.SIMPLIFY_TRIANGLES > 0 or self.SIMPLIFY_CELL > 0:
+                with self.profiler.stage("simplify basemesh/overlay vertices"):
+                    self.overlay_keys = dsf_extract.tile_overlay_keys(dsf, ter_layers, grid_west, grid_south, area, self.SCALING)
+            print("Streaming import with at most {} triangles per batch".format(max_triangles))
+            yield from dsf_extract.extract_batches(dsf, ter_layers, grid_west, grid_south, area, self.SCALING, True, max_triangles, self.profiler)
+        elif self.ENGINE == "NUMPY":
+            yield dsf_extract.extract_mesh(dsf, ter_layers, grid_west, grid_south, area, self.SCALING, self.LAYER_PER_OVERLAY, self.profiler)
+        else:
+            yield self.extract_mesh(dsf, ter_layers, terrain_details, grid_west, grid_south)
 
-            for i, tria in enumerate(bpy.context.object.data.polygons):  #### Use obj instead of context ??
-                tria.material_index = matIndexPerTria[layer][i]
+    def set_tile(self, grid_west, grid_south):
+        """
+        Sets origin of the tile and the area of the tile to be extracted.
+        """
+        self.grid_west = grid_west
+        self.grid_south = grid_south
+        if self.origin is None:  # first tile imported is placed at Blender origin, others next to it
+            self.origin = (grid_west, grid_south)
+        print("Importing Mesh and setting west={} and south={} to origin.".format(grid_west, grid_south))
+        self.AREA_W, self.AREA_E, self.AREA_S, self.AREA_N = dsf_extract.tile_area(self.AREA, grid_west, grid_south)
+        print("But extracting just from west {} to east {} and south {} to north {}".format(self.AREA_W, self.AREA_E, self.AREA_S, self.AREA_N))
 
+    def submit_terrains(self, pool, terrains, dsf_file):
+        """
+        Starts reading the terrain files of the terrain definitions in the thread pool.
+        Returns dict with terrain index as key and future of the terrain details as value.
+        """
+        return {id: pool.submit(self.read_ter_file, terrains[id], self.xp_path, dsf_file) for id in terrains}
 
-            new_uv = bpy.context.active_object.data.uv_layers.new(name='baseUV')  #### Use obj instead of context ??
-            for loop in bpy.context.active_object.data.loops:
-                new_uv.data[loop.index].uv = uvs[layer][loop.index]
-            bpy.context.object.data.uv_layers["baseUV"].active_render = True
+    def load_terrains(self, terrains, dsf_file, loading=None):
+        """
+        Loads all terrain files of the terrain definitions of the dsf into a dictionary with terrain index as key.
+        Files are read by TER_THREADS threads (see dsf_terrain.py). If reading was already started with
+        submit_terrains, its futures are given as loading. Then the "load terrains" stage only records the time
+        waiting for the files not yet read, reading meanwhile is part of the stages running at the same time.
+        """
+        if loading is None:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=dsf_terrain.TER_THREADS) as pool:
+                return self.load_terrains(terrains, dsf_file, self.submit_terrains(pool, terrains, dsf_file))
+        terrain_details = dict()  # containing per terrain index the details of .ter-file in dict
+        hits = self.terrain_cache.hits
+        with self.profiler.stage("load terrains", len(terrains)):
+            for id in terrains:
+                print("Loading Terrain {}".format(terrains[id]))
+                terrain_details[id] = loading[id].result()
+                if "ERROR" in terrain_details[id]:
+                    print(terrain_details[id]["ERROR"])
+            self.terrain_cache.save_index()
+        print("Loaded {} terrain details, {} terrain files read from cache".format(len(terrain_details), self.terrain_cache.hits - hits))
+        return terrain_details
+
+    def get_collection(self, name, parent):
+        """
+        Returns new collection name linked to parent. With INCREMENTAL the collection of an earlier import
+        of the same tile with this name is returned instead and its objects are added to previous_objects.
+        Collections are matched by TILE_PROPERTY, as Blender renames them to name.001 etc. if name is already
+        used, e.g. by the collection of another tile.
+        """
+        tile = "{}/{},{}".format(name, self.grid_west, self.grid_south)
+        if self.INCREMENTAL:
+            matches = [col for col in parent.children if col.get(TILE_PROPERTY) == tile]
+            if len(matches) > 1:
+                print("WARNING: {} collections of earlier imports of {}, updating only {}".format(len(matches), tile,
+                                                                                               matches[0].name))
+            for col in matches[:1]:
+                for obj in col.objects:
+                    if SOURCE_PROPERTY in obj:
+                        self.previous_objects[obj[SOURCE_PROPERTY]] = obj
+                return col
+        col = bpy.data.collections.new(name)
+        col[TILE_PROPERTY] = tile
+        parent.children.link(col)
+        return col
+
+    def start_objects(self, collection_name):
+        """
+        Starts creating the objects of a tile in collection collection_name with a collection for the overlays.
+        """
+        self.previous_objects = dict()
+        self.kept_objects = 0
+        self.built_objects = 0
+        self.batch = 0
+        self.main_collection = self.get_collection(collection_name, bpy.context.scene.collection)
+        self.ol_collection = self.get_collection("Overlays", self.main_collection)
+
+    def finish_objects(self):
+        """
+        Removes the objects of the earlier import that were not created again, e.g. because their layer is gone.
+        """
+        for obj in self.previous_objects.values():
+            remove_object(obj)
+        if self.INCREMENTAL:
+            print("Kept {} unchanged objects, built {} and removed {} objects".format(self.kept_objects, self.built_objects,
+                                                                                    len(self.previous_objects)))
+        self.previous_objects = dict()
+
+    def create_objects(self, terrains, terrain_details, batches, collection_name="XPDSF"):
+        """
+        Creates the Blender objects and materials for the batches of extracted meshes in own collections.
+        """
+        # Create own collection for basemesh and overlays
+        self.start_objects(collection_name)
+        self.created_materials = dict()  # containing per ter_layer_id the reference to the created blender material
+        if self.material_registry is None:
+            self.material_registry = MaterialRegistry()
+        hits, misses = self.material_registry.hits, self.material_registry.misses
 
+        batch = 0  # counted by hand, as the result tuple of enumerate would keep the previous batch alive
+        for extracted in batches:
+            self.batch = batch  # objects are identified by batch and name for INCREMENTAL
+            print("Arranged mesh of batch {} into {} layers with {} materials".format(batch, len(extracted[2]), len(extracted[5])))
+            self.add_layer_objects(terrains, terrain_details, *extracted)
+            del extracted  # free extracted data before the next batch is extracted
+            batch += 1
 
-            ######## ADDING BORDER UVS ###########
-            if layer > 0:  # we haver overlay
-                border_uv = bpy.context.active_object.data.uv_layers.new(name='borderUV')  #### Use obj instead of context ??
-                for loop in bpy.context.active_object.data.loops:
-                    border_uv.data[loop.index].uv = uvs2[layer][loop.index]
+        print("Using {} materials, {} created and {} reused".format(len(self.created_materials), self.material_registry.misses - misses,
+                                                                    self.material_registry.hits - hits))
+        self.finish_objects()
+
+    def add_heightfield(self, result, collection_name="XPDSF"):
+        """
+        Creates the heightfield object for the result of dsf_extract.heightfield_tile in an own collection.
+        The heightfield has no materials, uvs go from 0 to 1 over the area e.g. for an ortho photo.
+        """
+        grid_west, grid_south, verts, normals, faces, uvs = result
+        self.set_tile(grid_west, grid_south)
+        self.start_objects(collection_name)
+        print("Creating heightfield with {} triangles".format(len(faces)))
+        self.add_layer_object(self.main_collection, "Heightfield", 0, [], verts, normals, faces,
+                              np.zeros(len(faces), dtype=np.int32), uvs, None)
+        self.finish_objects()
+
+    def execute(self, dsf_file):
+        print("------------ Starting to use DSF ------------------")
+        print("Reading DSF file: {}".format(dsf_file))
+        self.xp_path = 'X:/X-Plane/steamapps/common/X-Plane 11'  ########### TBD: be retrieved from dsf file  ##########
+
+        if self.HEIGHTFIELD > 0:  # only elevations, so no terrains and no cache needed
+            self.add_heightfield(dsf_extract.heightfield_tile(dsf_file, self.AREA, self.SCALING, self.HEIGHTFIELD, self.profiler))
+            self.finish_report()
+            return {"FINISHED"}
+        
+        info = None  # info of cached extraction
+        self.overlay_keys = None
+        if self.CACHE_DIR:
+            cache_key = dsf_cache.cache_key(dsf_file, dsf_cache.import_options(self.AREA, self.SCALING, self.LAYER_PER_OVERLAY,
+                                                                               self.MEMORY_BUDGET, self.LOD_DISTANCE,
+                                                                               "NUMPY" if self.MEMORY_BUDGET else self.ENGINE))
+            info = dsf_cache.load_info(self.CACHE_DIR, cache_key)
+        if info:
+            print("Using extracted mesh from cache {}".format(cache_key))
+            self.set_tile(info["west"], info["south"])
+            terrains = info["terrains"]
+            terrain_details = self.load_terrains(terrains, dsf_file)
+            if len(info["batches"]) > 1 and (self.SIMPLIFY_TRIANGLES > 0 or self.SIMPLIFY_CELL > 0):
+                with self.profiler.stage("simplify basemesh/overlay vertices"):
+                    self.overlay_keys = dsf_extract.batches_overlay_keys(dsf_cache.load_batches(self.CACHE_DIR, cache_key, info))
+            batches = self.profiler.iterate("read cache", dsf_cache.load_batches(self.CACHE_DIR, cache_key, info))
+        else:
+            dsf = XPLNEDSF()
+            with self.profiler.stage("read dsf"):
+                dsf.read(dsf_file)
+            grid_west = int(dsf.Properties["sim/west"])
+            grid_south = int(dsf.Properties["sim/south"])
+            self.set_tile(grid_west, grid_south)
+            terrains = dsf.DefTerrains
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=dsf_terrain.TER_THREADS) as pool:
+                loading = self.submit_terrains(pool, terrains, dsf_file)  # terrain files are read while the mesh is extracted
+                with self.profiler.stage("sort patches", len(dsf.Patches)):
+                    ter_layers = dsf_extract.visible_layers(dsf_extract.sort_patches(dsf), self.LOD_DISTANCE)
+                print("Sorted {} mesh patches into {} different types".format(len(dsf.Patches), len(ter_layers)))        
+
+                if self.ENGINE == "PYTHON" and not self.MEMORY_BUDGET:  # python engine needs terrain details for extraction
+                    terrain_details = self.load_terrains(terrains, dsf_file, loading)
+                    batches = self.profiler.iterate("extract triangles", self.extract_batches(dsf, ter_layers, terrain_details, grid_west, grid_south))
+                else:
+                    batches = self.profiler.iterate("extract triangles", self.extract_batches(dsf, ter_layers, None, grid_west, grid_south))
+                    first = next(batches, None)  # extract first batch before waiting for the terrain files
+                    batches = prepend(first, batches)
+                    del first
+                    terrain_details = self.load_terrains(terrains, dsf_file, loading)
+            if self.CACHE_DIR:
+                batches = dsf_cache.save_batches(self.CACHE_DIR, cache_key, batches, grid_west, grid_south, terrains)
+
+        self.create_objects(terrains, terrain_details, batches)
+        self.finish_report()
 
-            ### Move overlays along z-axis
-            obj.location.z += layer * 0.01
-            
         return {"FINISHED"}
 
+    def execute_tiles(self, dsf_files):
+        """
+        Imports several dsf files. Reading and extraction of the tiles is done in parallel by a pool of
+        WORKERS processes, while the meshes are created one tile after the other in Blender.
+        Workers always use the numpy engine and extract full tiles without memory budget.
+        At most WORKERS tiles are extracted or waiting at the same time, so that extracted tiles do not pile up
+        in memory when meshes are created slower than the tiles are extracted.
+        """
+        if len(dsf_files) == 1:
+            return self.execute(dsf_files[0])
+        print("------------ Starting to use {} DSF files ------------------".format(len(dsf_files)))
+        self.xp_path = 'X:/X-Plane/steamapps/common/X-Plane 11'  ########### TBD: be retrieved from dsf file  ##########
+
+        workers = self.WORKERS or os.cpu_count() or 1
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [self.submit_tile(executor, dsf_file) for dsf_file in dsf_files[:workers]]
+
+            for i, dsf_file in enumerate(dsf_files):  # create meshes in order, while other tiles are still extracted
+                print("Importing DSF file: {}".format(dsf_file))
+                with self.profiler.stage("wait for extraction"):
+                    result = futures.pop(0).result()
+                if i + workers < len(dsf_files):  # next tile is extracted while the meshes of this tile are created
+                    futures.append(self.submit_tile(executor, dsf_files[i + workers]))
+                tile_name = os.path.splitext(os.path.basename(dsf_file))[0]
+                if self.HEIGHTFIELD > 0:
+                    self.add_heightfield(result, "XPDSF_" + tile_name)
+                    continue
+                if self.CACHE_DIR:
+                    info = dsf_cache.load_info(self.CACHE_DIR, result)
+                    grid_west, grid_south, terrains = info["west"], info["south"], info["terrains"]
+                    batches = self.profiler.iterate("read cache", dsf_cache.load_batches(self.CACHE_DIR, result, info))
+                else:
+                    grid_west, grid_south, terrains, extracted = result
+                    batches = [extracted]
+                    del extracted
+                del result
+                self.set_tile(grid_west, grid_south)
+                terrain_details = self.load_terrains(terrains, dsf_file)
+                self.create_objects(terrains, terrain_details, batches, "XPDSF_" + tile_name)
+        self.finish_report()
+
+        return {"FINISHED"}
+
+    def submit_tile(self, executor, dsf_file):
+        """
+        Starts extraction of dsf_file (or its heightfield) in the process pool executor and returns the future.
+        """
+        if self.HEIGHTFIELD > 0:
+            return executor.submit(dsf_extract.heightfield_tile, dsf_file, self.AREA, self.SCALING, self.HEIGHTFIELD)
+        if self.CACHE_DIR:  # workers store extraction in cache from where it is mapped without copying
+            return executor.submit(dsf_cache.extract_tile, dsf_file, self.AREA, self.SCALING, self.LAYER_PER_OVERLAY, self.CACHE_DIR,
+                                   self.LOD_DISTANCE)
+        return executor.submit(dsf_extract.extract_tile, dsf_file, self.AREA, self.SCALING, self.LAYER_PER_OVERLAY,
+                               self.LOD_DISTANCE)
+
+    def finish_report(self):
+        """
+        Prints the recorded stages of the import and writes them to REPORT_FILE as json if given.
+        The report is also available as dict from self.profiler.report().
+        With TEXTURES "BACKGROUND" loading of the textures is started now that the geometry exists.
+        """
+        if self.TEXTURES == "BACKGROUND" and self.lazy_images:
+            print("Loading {} textures in background".format(len(self.lazy_images)))
+            load_images_in_background(self.lazy_images.values())
+        self.profiler.print_report()
+        if self.REPORT_FILE:
+            self.profiler.write_json(self.REPORT_FILE)
+            print("Written import report to {}".format(self.REPORT_FILE))
+
 
 bl_info = {
     "name": "X-Plane Distribuation Scenery Format importer (.dsf)",
@@ -409,6 +857,16 @@ class ImportDSF(Operator, ImportHelper):
         default="*.dsf",
         options={'HIDDEN'},
     )
+
+    files: CollectionProperty(
+        type=OperatorFileListElement,
+        options={'HIDDEN', 'SKIP_SAVE'},
+    )
+
+    directory: StringProperty(
+        subtype='DIR_PATH',
+        options={'HIDDEN', 'SKIP_SAVE'},
+    )
     
     east_bound: FloatProperty(
         name="West bound",
@@ -457,23 +915,249 @@ class ImportDSF(Operator, ImportHelper):
         default=False
     )
 
+    engine: EnumProperty(
+        name="Extraction",
+        description="Engine used to extract the triangles from the dsf file",
+        items=(
+            ('NUMPY', "NumPy", "Extract all triangles of a patch at once with numpy arrays (fast)"),
+            ('PYTHON', "Python", "Extract triangle by triangle (slow, original implementation)"),
+        ),
+        default='NUMPY',
+    )
+
+    memory_budget: IntProperty(
+        name="Memory budget (MB)",
+        default=0,
+        description="Streams the dsf: after the arrays needed for the whole tile, meshes are created each time extracted data fills the rest of this size and overlays are seperated per terrain type (0 extracts full area at once)",
+        min=0,
+        max=65536,
+    )
+
+    grid_cells: IntProperty(
+        name="Sub-tiles per side",
+        default=1,
+        description="Split each layer into NxN objects over the area, so that only parts have to be shown or edited",
+        min=1,
+        max=32,
+    )
+
+    cache_dir: StringProperty(
+        name="Cache directory",
+        description="Directory to store extracted meshes, so that importing the same dsf with same settings again skips reading the dsf (empty for no cache)",
+        subtype='DIR_PATH',
+        default="",
+    )
+
+    workers: IntProperty(
+        name="Processes",
+        default=0,
+        description="Processes extracting tiles in parallel when several dsf files or a directory are selected (0 for number of cores)",
+        min=0,
+        max=64,
+    )
+
+    report_file: StringProperty(
+        name="Import report",
+        description="Json file to write time, memory and counts of the import stages to (empty for none)",
+        subtype='FILE_PATH',
+        default="",
+    )
+
+    textures: EnumProperty(
+        name="Textures",
+        description="When the texture files of the materials are read",
+        items=(
+            ('LOAD', "During import", "Read all textures during the import"),
+            ('LAZY', "On demand", "Read textures only when Blender needs them, e.g. in material preview"),
+            ('BACKGROUND', "After import", "Read textures one after the other once the geometry is imported"),
+        ),
+        default='LOAD',
+    )
+
+    proxy_size: IntProperty(
+        name="Texture proxy size",
+        description="Replace textures larger than this by reduced proxies stored in the cache directory (0 for original textures)",
+        default=0,
+        min=0,
+        max=16384,
+    )
+
+    lod_distance: FloatProperty(
+        name="LOD distance",
+        description="Import only patches X-Plane shows at this view distance in meters (-1 for all patches)",
+        default=-1.0,
+        min=-1.0,
+    )
+
+    lod_objects: BoolProperty(
+        name="Objects per LOD",
+        description="Split layers into objects per view distance range (near, far) of the patches",
+        default=False,
+    )
+
+    simplify_triangles: IntProperty(
+        name="Basemesh triangles",
+        description="Simplify the basemesh to about this number of triangles per tile or batch, keeping tile borders and overlays (0 for full basemesh)",
+        default=0,
+        min=0,
+    )
+
+    simplify_cell: FloatProperty(
+        name="Simplify cell size",
+        description="Merge basemesh vertices in cells of this size in Blender units instead of using a triangle count (0 to use triangle count)",
+        default=0.0,
+        min=0.0,
+    )
+
+    heightfield: IntProperty(
+        name="Heightfield resolution",
+        description="Import only a heightfield with this number of grid squares per side from the elevation raster instead of the mesh patches (0 for mesh)",
+        default=0,
+        min=0,
+        max=8192,
+    )
+
+    incremental: BoolProperty(
+        name="Incremental",
+        description="Update the objects of an earlier import of the same tiles, rebuilding only objects whose data changed",
+        default=False,
+    )
+
     def execute(self, context):
         """Executes the import process """
-        importer = DSF_loader(self.east_bound, self.west_bound, self.south_bound, self.north_bound, self.scaling, self.seperate_overlays)
-        return importer.execute(self.filepath)
+        importer = DSF_loader(self.east_bound, self.west_bound, self.south_bound, self.north_bound, self.scaling, self.seperate_overlays, self.engine, self.memory_budget, self.grid_cells, bpy.path.abspath(self.cache_dir), self.workers, bpy.path.abspath(self.report_file), self.textures, self.proxy_size,
+                              self.lod_distance, self.lod_objects, self.simplify_triangles, self.simplify_cell,
+                              self.heightfield, self.incremental)
+        dsf_files = [os.path.join(self.directory, f.name) for f in self.files if f.name]
+        if len(dsf_files) == 0:  # no file selected, so import all dsf files of the selected directory
+            dsf_files = dsf_extract.find_dsf_files(self.filepath)
+        if len(dsf_files) == 0:
+            self.report({'ERROR'}, "No dsf file found in: " + self.filepath)
+            return {'CANCELLED'}
+        return importer.execute_tiles(dsf_files)
+
+
+def object_hash(materials, verts, normals, faces, mat_index, uvs, uvs2):
+    """
+    Returns hash of the materials and the mesh data of an object as given to fill_mesh.
+    Arrays are hashed with the types they have in Blender, so the same data from the cache or a new extraction
+    gives the same hash.
+    """
+    h = hashlib.sha1()
+    h.update("|".join(m.name for m in materials).encode("utf8"))
+    for values, dtype in ((verts, np.float32), (normals, np.float32), (faces, np.int32), (mat_index, np.int32),
+                          (uvs, np.float32), (uvs2, np.float32)):
+        if values is not None:
+            h.update(np.ascontiguousarray(values, dtype=dtype).tobytes())
+        h.update(b"|")
+    return h.hexdigest()
+
+
+def prepend(first, iterator):
+    """
+    Yields first (unless it is None) and then the items of iterator. Unlike itertools.chain no reference to first
+    is kept after it was yielded, so a streamed batch is freed before the next one is extracted.
+    """
+    if first is not None:
+        yield first
+    del first
+    yield from iterator
+
+
+def find_image(filename):
+    """
+    Returns existing image with file filename or None, like images.load with check_existing but without loading.
+    """
+    filename = os.path.normpath(os.path.abspath(filename))
+    for image in bpy.data.images:
+        if image.source == 'FILE' and os.path.normpath(os.path.abspath(bpy.path.abspath(image.filepath))) == filename:
+            return image
+    return None
+
+
+def remove_object(obj):
+    """
+    Removes object and its mesh if no other object uses the mesh.
+    """
+    mesh = obj.data
+    bpy.data.objects.remove(obj)
+    if mesh.users == 0:
+        bpy.data.meshes.remove(mesh)
+
+
+def load_images_in_background(images):
+    """
+    Registers timer that reads the pixels of the images one after the other, while Blender is already showing
+    the imported geometry. Images deleted meanwhile are skipped.
+    """
+    images = list(images)
+
+    def load_next_image():
+        while images:
+            image = images.pop(0)
+            try:
+                image.size[0]  # reading the size makes Blender load the image file
+            except ReferenceError:
+                continue
+            return 0.01  # give Blender time to update the user interface before loading the next image
+        return None  # stops the timer
+
+    bpy.app.timers.register(load_next_image, first_interval=0.1)
+
+
+def switch_textures(use_proxies):
+    """
+    Switches all images created with texture proxies to the proxies or to the original textures.
+    Returns number of switched images.
+    """
+    switched = 0
+    for image in bpy.data.images:
+        if ORIGINAL_PROPERTY in image and PROXY_PROPERTY in image:
+            filename = image[PROXY_PROPERTY] if use_proxies else image[ORIGINAL_PROPERTY]
+            if image.filepath != filename:
+                image.filepath = filename  # Blender reads the new file when the image is needed
+                switched += 1
+    return switched
+
+
+class SwitchDSFTextures(Operator):
+    """Switch textures of imported dsf materials between reduced proxies and original files"""
+    bl_idname = "image.dsf_switch_textures"
+    bl_label = "Switch DSF Textures"
+
+    use_proxies: BoolProperty(
+        name="Use proxies",
+        description="Use reduced proxies instead of original textures",
+        default=False,
+    )
+
+    def execute(self, context):
+        switched = switch_textures(self.use_proxies)
+        self.report({'INFO'}, "Switched {} textures to {}".format(switched, "proxies" if self.use_proxies else "originals"))
+        return {'FINISHED'}
 
 
 def menu_func_import(self, context):
     self.layout.operator(ImportDSF.bl_idname, text="X-Plane DSF mesh (.dsf)")
 
 
+def menu_func_image(self, context):
+    self.layout.separator()
+    self.layout.operator(SwitchDSFTextures.bl_idname, text="DSF Textures to Proxies").use_proxies = True
+    self.layout.operator(SwitchDSFTextures.bl_idname, text="DSF Textures to Originals").use_proxies = False
+
+
 def register():
     bpy.utils.register_class(ImportDSF)
+    bpy.utils.register_class(SwitchDSFTextures)
     bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
+    bpy.types.IMAGE_MT_image.append(menu_func_image)
 
 
 def unregister():
+    bpy.types.IMAGE_MT_image.remove(menu_func_image)
     bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
+    bpy.utils.unregister_class(SwitchDSFTextures)
     bpy.utils.unregister_class(ImportDSF)
     
 
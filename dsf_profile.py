@@ -0,0 +1,146 @@
+# ******************************************************************************
+#
+# DSF2Blender: Python script for Blender that allows import of X-Plane DSF files
+#              Checked with Blender 3.0 but should work from 2.8 up
+#
+# For more details refer to GitHub: https://github.com/nofaceinbook/DSF2Blender
+#
+# WARNING: This code is still under development and may still have some errors.
+#
+# Copyright (C) 2022 by schmax (Max Schmidt)
+#
+# This code is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+# ******************************************************************************
+
+# Recording of time, memory and item counts for the stages of an import.
+# Stages are accumulated by name, so a stage running per batch or per tile appears once with all its calls.
+# Names containing / are parts of the stage before the /, e.g. "extract triangles/layer assignment".
+# This module does not use bpy, so it can also be used outside of Blender.
+
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+
+def peak_memory_mb():
+    """
+    Returns peak resident memory of this process in MB or None if not available on this system.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":  # bytes on macOS, kilobytes on Linux
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+class Profiler:
+    """
+    Records wall time, cpu time, memory and number of items per stage.
+    Without trace_memory only process_peak_mb is recorded, the peak resident memory of the process so far at the
+    end of the stage, which never goes down, so later stages repeat the high-water mark of earlier ones.
+    With trace_memory memory_mb is the peak of memory allocated by Python and numpy during the stage, including
+    its nested stages, which slows down the import.
+    A disabled profiler records nothing.
+    """
+    def __init__(self, enabled=True, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.stages = dict()  # name of stage as key and dict with the recorded values as value
+        self.start = time.perf_counter()
+        self.peaks = []  # with trace_memory for each running stage the peak before the last reset by a nested stage
+        if enabled and trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _stage_values(self, name):
+        if name not in self.stages:
+            self.stages[name] = {"calls": 0, "wall": 0.0, "cpu": 0.0, "memory_mb": None, "process_peak_mb": None, "items": 0}
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name, items=0):
+        """
+        Context manager recording the code inside the with-block as stage name.
+        """
+        if not self.enabled:
+            yield
+            return
+        if self.trace_memory:
+            if self.peaks:  # keep peak of the outer stage, before it is reset for this stage
+                self.peaks[-1] = max(self.peaks[-1], tracemalloc.get_traced_memory()[1])
+            self.peaks.append(0)
+            tracemalloc.reset_peak()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            values = self._stage_values(name)
+            values["calls"] += 1
+            values["wall"] += time.perf_counter() - wall
+            values["cpu"] += time.process_time() - cpu
+            values["items"] += items
+            if self.trace_memory:
+                peak = max(tracemalloc.get_traced_memory()[1], self.peaks.pop())
+                if self.peaks:
+                    self.peaks[-1] = max(self.peaks[-1], peak)
+                values["memory_mb"] = max(peak / (1024 * 1024), values["memory_mb"] or 0)
+            else:
+                memory = peak_memory_mb()
+                if memory is not None:
+                    values["process_peak_mb"] = max(memory, values["process_peak_mb"] or 0)
+
+    def count(self, name, items):
+        """
+        Adds number of items (e.g. triangles) to stage name.
+        """
+        if self.enabled:
+            self._stage_values(name)["items"] += items
+
+    def iterate(self, name, iterable):
+        """
+        Generator passing through the values of iterable while recording the time to get them as stage name.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    value = next(iterator)
+                except StopIteration:
+                    return
+            yield value
+            del value  # the next value is often produced in place of this one, e.g. streamed batches
+
+    def report(self):
+        """
+        Returns dict with the recorded values per stage and totals.
+        """
+        return {"stages": self.stages, "total_wall": time.perf_counter() - self.start, "peak_memory_mb": peak_memory_mb()}
+
+    def write_json(self, filename):
+        with open(filename, "w", encoding="utf8") as f:
+            json.dump(self.report(), f, indent=2)
+
+    def print_report(self):
+        for name, values in self.stages.items():
+            if self.trace_memory:
+                memory = "n/a" if values["memory_mb"] is None else "{:.1f} MB".format(values["memory_mb"])
+                label = "memory"
+            else:
+                memory = "n/a" if values["process_peak_mb"] is None else "{:.1f} MB".format(values["process_peak_mb"])
+                label = "peak so far"
+            print("STAGE {:<40} calls {:6d}  wall {:9.3f}s  cpu {:9.3f}s  {} {:>10}  items {}".format(
+                name, values["calls"], values["wall"], values["cpu"], label, memory, values["items"]))
+        print("TOTAL wall {:.3f}s".format(time.perf_counter() - self.start))
+
+
+NO_PROFILER = Profiler(enabled=False)  # used when nothing should be recorded
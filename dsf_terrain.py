@@ -0,0 +1,175 @@
+# ******************************************************************************
+#
+# DSF2Blender: Python script for Blender that allows import of X-Plane DSF files
+#              Checked with Blender 3.0 but should work from 2.8 up
+#
+# For more details refer to GitHub: https://github.com/nofaceinbook/DSF2Blender
+#
+# WARNING: This code is still under development and may still have some errors.
+#
+# Copyright (C) 2022 by schmax (Max Schmidt)
+#
+# This code is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+# ******************************************************************************
+
+# Reading of X-Plane terrain files (.ter) with a cache of the parsed files.
+# The cache is kept in memory for all imports in the same Blender session and can be stored as index file,
+# so that also later sessions do not read the same terrain files again. A cached terrain file is only used
+# as long as modification time and size of the file are unchanged.
+# This module does not use bpy, so it can also be used outside of Blender.
+
+import json
+import os
+import threading
+from collections import OrderedDict
+
+TER_CACHE_SIZE = 4096  # number of terrain files kept in memory
+INDEX_FILE = "terrains.json"  # name of the index file in the cache directory
+INDEX_VERSION = 1
+TER_THREADS = 8  # terrain files read at the same time, reading is limited by the drive not by Python
+
+
+def terrain_filename(terpath, xppath, dsf_path):
+    """
+    Returns filename of the terrain definition terpath or None if terpath is unknown.
+    To read default terrains the path for X-Plane (xppath) is needed.
+    dsf_path is the path of the dsf file that contains the terrain definition. Needed to read dsf specific terrain.
+    """
+    dsfpath = dsf_path.replace("\\", "/") ############ NEW ######## TBD: USE FILE DELIMITER INDEPENDENT COMMANDS ###########
+
+    if terpath.endswith('_OVL'):  #### TBD: Can probably be removed as function is called with terrain name now
+        terpath = terpath[:-4]  # remove _OVL now from terrain name
+
+    ### TBD: handle different path delimeters in given pathes like \ by replacing them ? ####
+    if terpath.startswith("lib/g10"):  # global XP 10 terrain definition
+        #### TBD: Build path correct for every file system ###
+        return xppath + "/Resources/default scenery/1000 world terrain" + terpath[7:]  # remove lib/g10
+    elif terpath.startswith("terrain/"):  # local dsf terrain definition
+        return dsfpath[:dsfpath.rfind("Earth nav data")] + terpath  # remove part for dsf location
+        ### TBD: Error check that terrain file exists
+    return None
+    ##### TBD: Build filename for local .ter files starting with ../ using dsfpath #######
+
+
+def parse_ter_file(filename):
+    """
+    Reads terrain file and returns values as dictionary with the first word of each line as key.
+    In case of errors the dict contains key ERROR with value containing description of error.
+    """
+    ter = dict()
+    try:
+        with open(filename, encoding="utf8") as f:
+            for line in f:  ### TBD: Check that first three lines contain A  800  TERRAIN   #####
+                values = line.split()
+                if len(values) > 0:  # skip empty line
+                    key = values.pop(0)
+                    if len(values) > 0 and values[0].startswith("../"):  # replace relative path with full path
+                        filepath = filename[:filename.rfind("/")]  # get just path without name of file in path
+                        values[0] = filepath[:filepath.rfind("/") + 1] + values[0][3:]
+                        ### TBD: Handle ERROR when '/' is not found; when other delimiters are used
+                    ter[key] = values
+                ### TBD: in case of multiple keys in files append new values to existing key
+    except IOError:
+        ter["ERROR"] = "Error reading terrain file: " + filename
+    return ter
+
+
+def read_ter_file(terpath, xppath, dsf_path, cache=None):
+    """
+    Reads X-Plane terrain file (.ter) in terpath and returns values as dictionary, using cache if given.
+    In case of errors the dict contains key ERROR with value containing description of error.
+    """
+    if terpath == 'terrain_Water':  # No terrian file for Water
+        return dict()
+    filename = terrain_filename(terpath, xppath, dsf_path)
+    if filename is None:
+        return {"ERROR": "Unknown Terrain definition: " + terpath}
+    if cache is None:
+        return parse_ter_file(filename)
+    return cache.read(filename)
+
+
+class TerrainCache:
+    """
+    Parsed terrain files per filename, keeping the size most recently used ones.
+    With index_file the cache is loaded from this file and stored there by save_index.
+    Files can be read by several threads at the same time.
+    """
+    def __init__(self, size=TER_CACHE_SIZE, index_file=""):
+        self.size = size
+        self.index_file = index_file
+        self.entries = OrderedDict()  # filename as key and modification time, size of file and parsed values as value
+        self.changed = False  # entries changed since index was loaded
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if index_file:
+            self.load_index()
+
+    def read(self, filename):
+        """
+        Returns values of terrain file like parse_ter_file, parsing it only if not in the cache or changed.
+        """
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return {"ERROR": "Error reading terrain file: " + filename}
+        with self.lock:
+            entry = self.entries.get(filename)
+            if entry is not None and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+                self.entries.move_to_end(filename)
+                self.hits += 1
+            else:
+                entry = None
+                self.misses += 1
+        if entry is None:
+            ter = parse_ter_file(filename)  # outside of lock, so that other threads read their files meanwhile
+            if "ERROR" in ter:
+                return ter
+            entry = (st.st_mtime_ns, st.st_size, ter)
+            with self.lock:
+                self.entries[filename] = entry
+                self.entries.move_to_end(filename)
+                if len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+                self.changed = True
+        return {key: list(values) for key, values in entry[2].items()}  # copy, so that cached values are not changed
+
+    def load_index(self):
+        try:
+            with open(self.index_file, encoding="utf8") as f:
+                index = json.load(f)
+        except (IOError, ValueError):
+            return
+        if index.get("version") != INDEX_VERSION:
+            return
+        for filename, mtime, size, ter in index["terrains"][-self.size:]:
+            self.entries[filename] = (mtime, size, ter)
+
+    def save_index(self):
+        """
+        Writes the entries to index_file if there is one and entries changed.
+        """
+        if not self.index_file or not self.changed:
+            return
+        with self.lock:
+            index = {"version": INDEX_VERSION, "terrains": [[filename, mtime, size, ter] for filename, (mtime, size, ter) in self.entries.items()]}
+        os.makedirs(os.path.dirname(os.path.abspath(self.index_file)), exist_ok=True)
+        with open(self.index_file + ".tmp", "w", encoding="utf8") as f:
+            json.dump(index, f)
+        os.replace(self.index_file + ".tmp", self.index_file)  # replace at once, so that no half written index is read
+        self.changed = False
+
+
+_caches = dict()  # TerrainCache per index file, kept for all imports in this session
+
+
+def terrain_cache(index_file=""):
+    """
+    Returns the TerrainCache shared by all imports for index_file; empty index_file for cache only in memory.
+    """
+    if index_file not in _caches:
+        _caches[index_file] = TerrainCache(TER_CACHE_SIZE, index_file)
+    return _caches[index_file]
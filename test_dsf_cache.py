@@ -0,0 +1,121 @@
+# ******************************************************************************
+#
+# DSF2Blender: Python script for Blender that allows import of X-Plane DSF files
+#              Checked with Blender 3.0 but should work from 2.8 up
+#
+# For more details refer to GitHub: https://github.com/nofaceinbook/DSF2Blender
+#
+# WARNING: This code is still under development and may still have some errors.
+#
+# Copyright (C) 2022 by schmax (Max Schmidt)
+#
+# This code is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+# ******************************************************************************
+
+# Checks of the disk cache in dsf_cache.py: .dsfmesh files and cache entries written and read again.
+# Neither bpy nor xplnedsf2 are needed.
+# Run with pytest or directly: python test_dsf_cache.py
+
+import os
+import struct
+import tempfile
+import numpy as np
+
+import dsf_bench
+import dsf_cache
+import dsf_extract
+
+
+def mesh_arrays():
+    rng = np.random.default_rng(4)
+    return {"verts": rng.random((10, 3)), "normals": rng.random((10, 3)),
+            "faces_0": rng.integers(0, 10, (7, 3)), "uvs_0": rng.random((21, 2)), "uvs2_0": rng.random((21, 2)),
+            "mats_0": rng.integers(0, 3, 7), "faces_1": np.zeros((0, 3)), "uvs_1": np.zeros((0, 2)),
+            "uvs2_1": np.zeros((0, 2)), "mats_1": np.zeros(0)}
+
+
+def test_mesh_file_round_trip():
+    arrays = mesh_arrays()
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "batch_0.dsfmesh")
+        dsf_cache.write_mesh_file(filename, arrays)
+        data = dsf_cache.map_mesh_file(filename)
+        assert sorted(data.keys()) == sorted(arrays.keys())
+        for name, a in arrays.items():
+            dtype, columns = dsf_cache.BLOCK_TYPES[name.split("_")[0]]
+            expected = np.asarray(a, dtype=dtype)
+            assert data[name].dtype == np.dtype(dtype)
+            assert data[name].shape == (expected.reshape(-1, columns) if columns else expected).shape
+            assert np.array_equal(data[name].ravel(), expected.ravel())
+            assert not data[name].flags.writeable
+            # mapped file starts at a page, so the address shows the alignment of the block in the file
+            assert data[name].__array_interface__["data"][0] % dsf_cache.BLOCK_ALIGN == 0
+        del data
+
+
+def test_mesh_file_of_other_version_or_type_is_refused():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "batch_0.dsfmesh")
+        dsf_cache.write_mesh_file(filename, mesh_arrays())
+        with open(filename, "r+b") as f:
+            f.seek(len(dsf_cache.MESH_MAGIC))
+            f.write(struct.pack("<I", dsf_cache.CACHE_VERSION - 1))
+        for content in (None, b"NOMESH00" + bytes(64)):
+            if content is not None:
+                with open(filename, "wb") as f:
+                    f.write(content)
+            try:
+                dsf_cache.map_mesh_file(filename)
+            except ValueError:
+                continue
+            assert False, "no ValueError"
+
+
+def test_cache_entry_round_trip():
+    dsf = dsf_bench.SyntheticDSF(32)
+    ter_layers = dsf_extract.sort_patches(dsf)
+    area = dsf_extract.tile_area((0.0, 1.0, 0.0, 1.0), dsf.west, dsf.south)
+    batches = list(dsf_extract.extract_batches(dsf, ter_layers, dsf.west, dsf.south, area, 1000, False, 500))
+    terrains = {i: name for i, name in enumerate(dsf.DefTerrains)}
+    with tempfile.TemporaryDirectory() as directory:
+        assert dsf_cache.load_info(directory, "key") is None
+        saving = dsf_cache.save_batches(directory, "key", iter(batches), dsf.west, dsf.south, terrains)
+        next(saving)
+        assert dsf_cache.load_info(directory, "key") is None  # entry is only found after the last batch
+        for _ in saving:
+            pass
+        info = dsf_cache.load_info(directory, "key")
+        assert (info["west"], info["south"], info["terrains"]) == (dsf.west, dsf.south, terrains)
+        loaded = list(dsf_cache.load_batches(directory, "key", info))
+        assert len(loaded) == len(batches) > 1
+        for got, extracted in zip(loaded, batches):
+            verts, normals, faces, uvs, uvs2, materials, mat_index, used_materials = extracted
+            assert np.allclose(got[0], np.asarray(verts).reshape(-1, 3)) and np.allclose(got[1], np.asarray(normals).reshape(-1, 3))
+            for values, expected in ((got[2], faces), (got[3], uvs), (got[4], uvs2), (got[6], mat_index)):
+                assert len(values) == len(expected)
+                assert all(np.allclose(np.ravel(v), np.ravel(e)) for v, e in zip(values, expected))
+            assert got[5] == [tuple(m) for m in materials] and got[7] == [list(u) for u in used_materials]
+        del loaded, got
+
+
+def test_cache_key_changes_with_file_and_options():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "tile.dsf")
+        with open(filename, "wb") as f:
+            f.write(b"XPLNEDSF" + bytes(100))
+        options = dsf_cache.import_options((0.0, 1.0, 0.0, 1.0), 1000, False, 0)
+        key = dsf_cache.cache_key(filename, options)
+        assert dsf_cache.cache_key(filename, options) == key
+        assert dsf_cache.cache_key(filename, dsf_cache.import_options((0.0, 1.0, 0.0, 1.0), 1000, True, 0)) != key
+        with open(filename, "ab") as f:
+            f.write(b"changed")
+        assert dsf_cache.cache_key(filename, options) != key
+
+
+if __name__ == "__main__":
+    for name, function in list(globals().items()):
+        if name.startswith("test_"):
+            function()
+            print("OK", name)
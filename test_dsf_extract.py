@@ -0,0 +1,306 @@
+# ******************************************************************************
+#
+# DSF2Blender: Python script for Blender that allows import of X-Plane DSF files
+#              Checked with Blender 3.0 but should work from 2.8 up
+#
+# For more details refer to GitHub: https://github.com/nofaceinbook/DSF2Blender
+#
+# WARNING: This code is still under development and may still have some errors.
+#
+# Copyright (C) 2022 by schmax (Max Schmidt)
+#
+# This code is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+# ******************************************************************************
+
+# Checks of the numpy extraction in dsf_extract.py against a reference extraction triangle by triangle,
+# which is the loop of the PYTHON engine (DSF_loader.extract_mesh) without Blender, on the synthetic tile
+# of dsf_bench.py. Neither bpy nor xplnedsf2 are needed.
+# Run with pytest or directly: python test_dsf_extract.py
+
+from math import sqrt
+import numpy as np
+
+import dsf_bench
+import dsf_extract
+
+AREAS = [(0.0, 1.0, 0.0, 1.0), (0.3, 0.6, 0.2, 0.45)]
+
+
+def reference_mesh(dsf, ter_layers, grid_west, grid_south, area, scaling, layer_per_overlay):
+    """
+    Extraction like the loop of DSF_loader.extract_mesh, with the same results as dsf_extract.extract_mesh.
+    Unlike the loop, layers are added until the layer needed exists, as overlay terrains outside the area
+    leave layers empty with layer per overlay.
+    """
+    area_w, area_e, area_s, area_n = area
+    verts, normals, faces, uvs, uvs2 = [], [], [[]], [[]], [[]]
+    coords = dict()
+    tria_layer = dict()
+    materials, mat_index, used_materials = [], [[]], [[]]
+    layer = -1
+
+    def inside(v):
+        return area_w <= v[0] <= area_e and area_s <= v[1] <= area_n
+
+    for ter_layer_id in sorted(ter_layers.keys()):
+        water = (dsf.DefTerrains[ter_layer_id[1]] == "terrain_Water")
+        if layer_per_overlay:
+            layer = 0 if ter_layer_id[0] == 1 else layer + 1
+        for p in ter_layers[ter_layer_id]:
+            trias = p.triangles()
+            projected_uv = water and len(trias) > 0 and len(dsf.V[trias[0][0][0]][trias[0][0][1]]) <= 5
+            for t in trias:
+                if not any(inside(dsf.V[v[0]][v[1]]) for v in t):
+                    continue
+                ti, tuvs, tuvs2 = [], [], []
+                for v in t:
+                    values = dsf.V[v[0]][v[1]]
+                    vx = round((values[0] - grid_west) * scaling, 3)
+                    vy = round((values[1] - grid_south) * scaling, 3)
+                    if (vx, vy) not in coords:
+                        coords[(vx, vy)] = len(coords)
+                        vz = dsf.getVertexElevation(values[0], values[1], values[2])
+                        verts.append([vx, vy, round(vz / (100000 / scaling), 3)])
+                        nx = round(values[3], 4)
+                        ny = round(values[4], 4)
+                        normals.append([nx, ny, round(sqrt(1 - nx * nx - ny * ny), 4)])
+                    ti.insert(0, coords[(vx, vy)])
+                    own = (vx / 100, vy / 100)
+                    if len(values) == 7 and not projected_uv and p.flag == 1:
+                        tuvs.insert(0, (values[5], values[6]))
+                        tuvs2.insert(0, own)
+                    elif len(values) == 7:
+                        tuvs.insert(0, own)
+                        tuvs2.insert(0, (values[5], values[6]))
+                    elif len(values) == 9:
+                        tuvs.insert(0, (values[5], values[6]))
+                        tuvs2.insert(0, (values[7], values[8]))
+                    else:
+                        tuvs.insert(0, own)
+                        tuvs2.insert(0, own)
+                if not layer_per_overlay:
+                    i = ti.index(min(ti))
+                    ti_match = tuple(ti[i:] + ti[:i])
+                    tria_layer[ti_match] = tria_layer.get(ti_match, -1) + 1
+                    layer = tria_layer[ti_match]
+                while layer >= len(faces):
+                    for values in (faces, uvs, uvs2, mat_index, used_materials):
+                        values.append([])
+                faces[layer].append(ti)
+                uvs[layer].extend(tuvs)
+                uvs2[layer].extend(tuvs2)
+                if len(materials) == 0 or ter_layer_id != materials[-1]:
+                    materials.append(ter_layer_id)
+                if len(used_materials[layer]) == 0 or len(materials) - 1 != used_materials[layer][-1]:
+                    used_materials[layer].append(len(materials) - 1)
+                mat_index[layer].append(len(used_materials[layer]) - 1)
+    return verts, normals, faces, uvs, uvs2, materials, mat_index, used_materials
+
+
+def assert_same_mesh(result, reference):
+    verts, normals, faces, uvs, uvs2, materials, mat_index, used_materials = result
+    assert np.array_equal(np.asarray(verts).reshape(-1, 3), np.asarray(reference[0]).reshape(-1, 3))
+    assert np.array_equal(np.asarray(normals).reshape(-1, 3), np.asarray(reference[1]).reshape(-1, 3))
+    assert [tuple(m) for m in materials] == [tuple(m) for m in reference[5]]
+    n_layers = max(len(faces), len(reference[2]))
+    for layer in range(n_layers):
+        for values, ref, columns in ((faces, reference[2], 3), (uvs, reference[3], 2), (mat_index, reference[6], 1)):
+            got = np.asarray(values[layer] if layer < len(values) else []).reshape(-1, columns)
+            want = np.asarray(ref[layer] if layer < len(ref) else []).reshape(-1, columns)
+            assert np.array_equal(got, want), "layer {}".format(layer)
+        got = list(used_materials[layer]) if layer < len(used_materials) else []
+        assert got == (reference[7][layer] if layer < len(reference[7]) else [])
+        if layer > 0:  # border uvs are only used by overlays
+            assert np.array_equal(np.asarray(uvs2[layer]).reshape(-1, 2), np.asarray(reference[4][layer]).reshape(-1, 2))
+
+
+def test_extract_mesh_matches_reference():
+    dsf = dsf_bench.SyntheticDSF(64)
+    ter_layers = dsf_extract.sort_patches(dsf)
+    for relative_area in AREAS:
+        area = dsf_extract.tile_area(relative_area, dsf.west, dsf.south)
+        for layer_per_overlay in (False, True):
+            result = dsf_extract.extract_mesh(dsf, ter_layers, dsf.west, dsf.south, area, 1000, layer_per_overlay)
+            reference = reference_mesh(dsf, ter_layers, dsf.west, dsf.south, area, 1000, layer_per_overlay)
+            assert_same_mesh(result, reference)
+
+
+def test_weld_numbers_vertices_in_order_of_appearance():
+    keys = np.random.default_rng(1).integers(0, 50, 500)
+    vi, first = dsf_extract.weld(keys)
+    index = dict()
+    for k in keys.tolist():
+        index.setdefault(k, len(index))
+    assert vi.tolist() == [index[k] for k in keys.tolist()]
+    assert keys[first].tolist() == list(index.keys())
+
+
+def test_vertex_keys_are_unique_per_coordinates():
+    kx = np.array([0, 0, 1, -1, 2**31 - 1, -2**31])
+    ky = np.array([0, 1, 0, -1, -2**31, 2**31 - 1])
+    keys = dsf_extract.vertex_keys(kx, ky)
+    assert len(np.unique(keys)) == len(keys)
+
+
+def test_triangle_layers_counts_equal_triangles():
+    vi = np.array([[0, 1, 2], [1, 2, 0], [2, 1, 0], [2, 0, 1], [3, 4, 5], [0, 1, 2]])
+    assert dsf_extract.triangle_layers(vi).tolist() == [0, 1, 0, 2, 0, 3]
+
+
+def test_compact_vertices_removes_loose_vertices():
+    verts = np.arange(15, dtype=np.float64).reshape(5, 3)
+    faces = np.array([[4, 1, 3]])
+    new_verts, new_normals, new_faces = dsf_extract.compact_vertices(verts, verts, faces)
+    assert np.array_equal(new_verts[new_faces], verts[faces])
+    assert len(new_verts) == 3
+
+
+def test_simplify_mesh_keeps_border_and_overlay_vertices():
+    n = 40
+    x, y = np.meshgrid(np.arange(n + 1), np.arange(n + 1), indexing="ij")
+    verts = np.column_stack((x.ravel(), y.ravel(), np.zeros(x.size)))
+    a = (x[:-1, :-1] * (n + 1) + y[:-1, :-1]).ravel()
+    faces = np.concatenate((np.column_stack((a, a + n + 1, a + n + 2)), np.column_stack((a, a + n + 2, a + 1))))
+    overlay = faces[800]  # overlays use triangles of the basemesh
+    trias, new_faces = dsf_extract.simplify_mesh(verts, faces, overlay, 500)
+    assert 0 < len(trias) <= 500
+    kept = set(np.unique(new_faces).tolist())
+    assert set(dsf_extract.boundary_vertices(faces).tolist()) <= kept
+    assert 800 in trias.tolist() and new_faces[trias.tolist().index(800)].tolist() == overlay.tolist()
+    assert np.array_equal(np.sort(dsf_extract.boundary_vertices(new_faces)), np.sort(dsf_extract.boundary_vertices(faces)))
+
+
+def test_merged_uvs_are_taken_from_the_kept_vertex():
+    n = 20
+    x, y = np.meshgrid(np.arange(n + 1), np.arange(n + 1), indexing="ij")
+    verts = np.column_stack((x.ravel(), y.ravel(), np.zeros(x.size)))
+    a = (x[:-1, :-1] * (n + 1) + y[:-1, :-1]).ravel()
+    faces = np.concatenate((np.column_stack((a, a + n + 1, a + n + 2)), np.column_stack((a, a + n + 2, a + 1))))
+    mats = (verts[faces[:, 0], 0] >= n / 2).astype(np.int64)  # two materials with different uvs at their border
+    uvs = verts[faces][:, :, :2] / 100 + mats[:, np.newaxis, np.newaxis]
+    trias, new_faces = dsf_extract.simplify_mesh(verts, faces, [], 100)
+    new_uvs = dsf_extract.merged_uvs(faces, trias, new_faces, mats, uvs)
+    expected = verts[new_faces][:, :, :2] / 100 + mats[trias][:, np.newaxis, np.newaxis]
+    pairs = set(zip(faces.ravel().tolist(), np.repeat(mats, 3).tolist()))  # vertices with their materials
+    same = np.array([[(v, m) in pairs for v in f] for f, m in zip(new_faces.tolist(), mats[trias].tolist())])
+    assert same.sum() > 0.9 * same.size
+    assert np.allclose(new_uvs[same], expected[same])
+    assert np.allclose(new_uvs[~same], uvs[trias][~same])
+    assert not np.allclose(uvs[trias], expected)
+
+
+def test_overlay_keys_of_tile_match_streamed_batches():
+    dsf = dsf_bench.SyntheticDSF(64)
+    ter_layers = dsf_extract.sort_patches(dsf)
+    area = dsf_extract.tile_area(AREAS[1], dsf.west, dsf.south)
+    batches = dsf_extract.extract_batches(dsf, ter_layers, dsf.west, dsf.south, area, 1000, True, 3000)
+    assert np.array_equal(dsf_extract.tile_overlay_keys(dsf, ter_layers, dsf.west, dsf.south, area, 1000),
+                          dsf_extract.batches_overlay_keys(batches))
+
+
+class RasterDSF:
+    """
+    Tile with an elevation raster stored as rows from south to north with scale and offset not applied,
+    where getVertexElevation interpolates bilinear between samples in the center of their area.
+    """
+    class Raster:
+        def __init__(self, data, flags):
+            self.height, self.width = data.shape
+            self.data = data.tolist()
+            self.scale = 0.5
+            self.offset = -20.0
+            self.flags = flags
+
+    def __init__(self, flags=0, elevation=None):
+        rows = np.random.default_rng(2).integers(0, 2000, (7, 9))
+        self.Raster = [self.Raster(rows, flags)]
+        self.Properties = {"sim/west": "8", "sim/south": "50"}
+        self.elevation = elevation
+
+    def getVertexElevation(self, x, y, z=dsf_extract.RASTER_ELEVATION):
+        if self.elevation is not None:
+            return self.elevation(x - 8, y - 50)
+        r = self.Raster[0]
+        rows = np.array(r.data, dtype=np.float64) * r.scale + r.offset
+        px = min(max((x - 8) * r.width - 0.5, 0), r.width - 1)
+        py = min(max((y - 50) * r.height - 0.5, 0), r.height - 1)
+        x0, y0 = min(int(px), r.width - 2), min(int(py), r.height - 2)
+        fx, fy = px - x0, py - y0
+        return ((rows[y0, x0] * (1 - fx) + rows[y0, x0 + 1] * fx) * (1 - fy)
+                + (rows[y0 + 1, x0] * (1 - fx) + rows[y0 + 1, x0 + 1] * fx) * fy)
+
+
+def test_raster_sampler_matches_vertex_elevation():
+    points = np.random.default_rng(3).random((200, 2))
+    for flags in (0, dsf_extract.RASTER_POST_CENTRIC):  # flags of the dsf must not matter when they do not fit
+        dsf = RasterDSF(flags)
+        sampler = dsf_extract.dsf_raster(dsf)
+        assert sampler.variant is not None
+        expected = [dsf.getVertexElevation(8 + x, 50 + y) for x, y in points.tolist()]
+        assert np.allclose(sampler.sample(points[:, 0], points[:, 1]), expected, rtol=0, atol=1e-6)
+
+
+class IslandDSF(RasterDSF):
+    """
+    Tile of sea at 0 m with a small island of 500 m, raster stored as rows from south to north with samples
+    on the borders of the tile, where getVertexElevation interpolates bilinear. Random check points miss the island.
+    """
+    def __init__(self):
+        rows = np.zeros((121, 121))
+        rows[20:23, 96:99] = 500.0  # around x 0.8, y 0.175
+        self.Raster = [self.Raster(rows, dsf_extract.RASTER_POST_CENTRIC)]
+        self.Raster[0].scale, self.Raster[0].offset = 1.0, 0.0
+        self.Properties = {"sim/west": "8", "sim/south": "50"}
+        self.rows = rows
+
+    def getVertexElevation(self, x, y, z=dsf_extract.RASTER_ELEVATION):
+        rows = self.rows
+        px, py = (x - 8) * 120, (y - 50) * 120
+        x0, y0 = min(int(px), 119), min(int(py), 119)
+        fx, fy = px - x0, py - y0
+        return ((rows[y0, x0] * (1 - fx) + rows[y0, x0 + 1] * fx) * (1 - fy)
+                + (rows[y0 + 1, x0] * (1 - fx) + rows[y0 + 1, x0 + 1] * fx) * fy)
+
+
+def test_raster_sampler_finds_layout_of_flat_raster():
+    dsf = IslandDSF()
+    sampler = dsf_extract.dsf_raster(dsf)
+    assert sampler.variant is not None
+    points = np.column_stack((np.linspace(0.78, 0.84, 25), np.linspace(0.15, 0.2, 25)))
+    expected = [dsf.getVertexElevation(8 + x, 50 + y) for x, y in points.tolist()]
+    assert max(expected) == 500.0
+    assert np.allclose(sampler.sample(points[:, 0], points[:, 1]), expected, rtol=0, atol=1e-6)
+
+
+def test_grid_elevations_match_vertex_elevation():
+    dsf = RasterDSF()
+    grid = dsf_extract.grid_elevations(dsf, (8.25, 8.75, 50.0, 50.5), 10)
+    lon, lat = np.meshgrid(np.linspace(8.25, 8.75, 11), np.linspace(50.0, 50.5, 11), indexing="ij")
+    expected = [dsf.getVertexElevation(x, y) for x, y in zip(lon.ravel().tolist(), lat.ravel().tolist())]
+    assert np.allclose(grid.ravel(), expected, rtol=0, atol=1e-6)
+
+
+def test_grid_elevations_of_flat_raster_match_vertex_elevation():
+    dsf = IslandDSF()
+    grid = dsf_extract.grid_elevations(dsf, (8.7, 8.9, 50.1, 50.3), 48)
+    lon, lat = np.meshgrid(np.linspace(8.7, 8.9, 49), np.linspace(50.1, 50.3, 49), indexing="ij")
+    expected = [dsf.getVertexElevation(x, y) for x, y in zip(lon.ravel().tolist(), lat.ravel().tolist())]
+    assert max(expected) == 500.0
+    assert np.allclose(grid.ravel(), expected, rtol=0, atol=1e-6)
+
+
+def test_raster_sampler_looks_up_elevations_it_can_not_sample():
+    dsf = RasterDSF(elevation=lambda x, y: 100 * np.sin(7 * x) * np.cos(5 * y))
+    sampler = dsf_extract.dsf_raster(dsf)
+    assert sampler.variant is None
+    x, y = np.array([0.1, 0.7]), np.array([0.9, 0.3])
+    assert np.allclose(sampler.sample(x, y), 100 * np.sin(7 * x) * np.cos(5 * y))
+
+
+if __name__ == "__main__":
+    for name, function in list(globals().items()):
+        if name.startswith("test_"):
+            function()
+            print("OK", name)
@@ -0,0 +1,110 @@
+# ******************************************************************************
+#
+# DSF2Blender: Python script for Blender that allows import of X-Plane DSF files
+#              Checked with Blender 3.0 but should work from 2.8 up
+#
+# For more details refer to GitHub: https://github.com/nofaceinbook/DSF2Blender
+#
+# WARNING: This code is still under development and may still have some errors.
+#
+# Copyright (C) 2022 by schmax (Max Schmidt)
+#
+# This code is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE.
+# ******************************************************************************
+
+# Checks of the terrain cache in dsf_terrain.py: invalidation, eviction and index file.
+# Neither bpy nor xplnedsf2 are needed.
+# Run with pytest or directly: python test_dsf_terrain.py
+
+import os
+import tempfile
+
+import dsf_terrain
+
+
+def write_ter(directory, name, texture):
+    filename = os.path.join(directory, name).replace("\\", "/")
+    with open(filename, "w", encoding="utf8") as f:
+        f.write("A\n800\nTERRAIN\n\nBASE_TEX {} 1000\n".format(texture))
+    return filename
+
+
+def test_changed_terrain_file_is_read_again():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = write_ter(directory, "grass.ter", "grass.png")
+        cache = dsf_terrain.TerrainCache(4)
+        assert cache.read(filename)["BASE_TEX"] == ["grass.png", "1000"]
+        assert cache.read(filename)["BASE_TEX"] == ["grass.png", "1000"]
+        assert (cache.hits, cache.misses) == (1, 1)
+        write_ter(directory, "grass.ter", "new_grass.png")  # other size
+        assert cache.read(filename)["BASE_TEX"] == ["new_grass.png", "1000"]
+        write_ter(directory, "grass.ter", "old_grass.png")  # same size, other time
+        st = os.stat(filename)
+        os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        assert cache.read(filename)["BASE_TEX"] == ["old_grass.png", "1000"]
+        assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_cached_values_are_copies():
+    with tempfile.TemporaryDirectory() as directory:
+        filename = write_ter(directory, "grass.ter", "grass.png")
+        cache = dsf_terrain.TerrainCache(4)
+        cache.read(filename)["BASE_TEX"][0] = "changed.png"
+        assert cache.read(filename)["BASE_TEX"][0] == "grass.png"
+
+
+def test_least_recently_used_file_is_evicted():
+    with tempfile.TemporaryDirectory() as directory:
+        files = [write_ter(directory, "t{}.ter".format(i), "t{}.png".format(i)) for i in range(3)]
+        cache = dsf_terrain.TerrainCache(2)
+        cache.read(files[0])
+        cache.read(files[1])
+        cache.read(files[0])  # files[1] is now the least recently used
+        cache.read(files[2])
+        assert list(cache.entries.keys()) == [files[0], files[2]]
+
+
+def test_missing_file_is_not_cached():
+    with tempfile.TemporaryDirectory() as directory:
+        cache = dsf_terrain.TerrainCache(4)
+        assert "ERROR" in cache.read(os.path.join(directory, "missing.ter"))
+        assert len(cache.entries) == 0
+
+
+def test_index_is_saved_and_loaded():
+    with tempfile.TemporaryDirectory() as directory:
+        files = [write_ter(directory, "t{}.ter".format(i), "t{}.png".format(i)) for i in range(3)]
+        index_file = os.path.join(directory, "cache", dsf_terrain.INDEX_FILE)
+        cache = dsf_terrain.TerrainCache(4, index_file)
+        for filename in files:
+            cache.read(filename)
+        cache.save_index()
+        assert not cache.changed and os.path.exists(index_file)
+
+        loaded = dsf_terrain.TerrainCache(2, index_file)  # keeps only the most recently used files
+        assert list(loaded.entries.keys()) == files[1:]
+        assert loaded.read(files[2])["BASE_TEX"] == ["t2.png", "1000"]
+        assert (loaded.hits, loaded.misses) == (1, 0)
+        write_ter(directory, "t1.ter", "changed_t1.png")
+        assert loaded.read(files[1])["BASE_TEX"] == ["changed_t1.png", "1000"]
+        assert loaded.misses == 1
+
+
+def test_index_of_other_version_is_ignored():
+    with tempfile.TemporaryDirectory() as directory:
+        index_file = os.path.join(directory, dsf_terrain.INDEX_FILE)
+        with open(index_file, "w", encoding="utf8") as f:
+            f.write('{"version": 0, "terrains": [["x.ter", 1, 2, {}]]}')
+        assert len(dsf_terrain.TerrainCache(4, index_file).entries) == 0
+        with open(index_file, "w", encoding="utf8") as f:
+            f.write("no json")
+        assert len(dsf_terrain.TerrainCache(4, index_file).entries) == 0
+
+
+if __name__ == "__main__":
+    for name, function in list(globals().items()):
+        if name.startswith("test_"):
+            function()
+            print("OK", name)